@@ -0,0 +1,51 @@
+"""
+Брошенные корзины: статистика и удаление пачками.
+
+Корзина брошена, если ни одна её строка не менялась с cutoff
+(MAX(updated_at) по пользователю, индекс cart_item_user_updated_idx).
+Удаление — DELETE ... WHERE id IN (SELECT id ... LIMIT n): каждая пачка —
+короткий отдельный запрос, блокировка таблицы (SQLite) не держится долго.
+Брони остатков под такими строками снимаются сами по истечении срока
+(release_expired_reservations).
+"""
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Sum
+
+from .models import CartItem
+
+
+def abandoned_users(cutoff):
+    return (
+        CartItem.objects.values('user_id')
+        .annotate(last_change=Max('updated_at'))
+        .filter(last_change__lt=cutoff)
+        .values('user_id')
+    )
+
+
+def abandoned_lines(cutoff):
+    return CartItem.objects.filter(user_id__in=abandoned_users(cutoff))
+
+
+def abandoned_cart_stats(cutoff):
+    """Сколько корзин, строк, единиц и на какую сумму (по текущим ценам) брошено."""
+    stats = abandoned_lines(cutoff).aggregate(
+        carts=Count('user_id', distinct=True),
+        lines=Count('id'),
+        units=Sum('quantity'),
+        value=Sum(ExpressionWrapper(
+            F('quantity') * F('product__new_price'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )),
+        oldest=Min('updated_at'),
+    )
+    stats['units'] = stats['units'] or 0
+    stats['value'] = stats['value'] or 0
+    return stats
+
+
+def delete_abandoned_batch(cutoff, batch_size=500):
+    """Удаляет до batch_size строк брошенных корзин одним DELETE. Возвращает число удалённых."""
+    batch = abandoned_lines(cutoff).order_by('id').values('id')[:batch_size]
+    deleted, _ = CartItem.objects.filter(id__in=batch).delete()
+    return deleted
@@ -1,8 +1,25 @@
+from pathlib import Path
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import path
+from django.utils import timezone
 from django.utils.html import format_html
-from django.db.models import Sum, Count
+from django.db.models import F, Sum, Count
 from decimal import Decimal
-from .models import Category, Product, CartItem, Order, OrderItem
+from .events import set_status
+from .exports import ORDER_EXPORT_HEADER, order_export_rows, streaming_export
+from .images import build_variants
+from .outbox import emit_many
+from .price_history import record_prices, to_cents
+from .suggest import bump_catalog_version
+from .models import (
+    Category, Product, ProductVariant, CartItem, Order, OrderItem, StockReservation,
+    ArchivedOrder, ArchivedOrderItem, Promotion,
+)
 
 
 # === Вспомогательная функция для форматирования валюты ===
@@ -25,7 +42,8 @@ class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ('subtotal_inline_display',)
-    fields = ('product', 'quantity', 'subtotal_inline_display')
+    # Пустая цена — текущая цена товара (signals.remember_order_line)
+    fields = ('product', 'variant', 'quantity', 'price', 'subtotal_inline_display')
 
     def subtotal_inline_display(self, obj):
         if obj.pk:
@@ -41,10 +59,18 @@ class OrderItemInline(admin.TabularInline):
 # === Category Admin ===
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'product_count', 'total_value')
+    list_display = ('tree_name', 'parent', 'description', 'product_count', 'total_value')
     search_fields = ('name', 'description')
+    list_select_related = ('parent',)
+    ordering = ('path',)
     list_per_page = 20
 
+    def tree_name(self, obj):
+        return format_html('<span style="padding-left: {}px;">{}</span>', obj.depth * 20, obj.name)
+
+    tree_name.short_description = 'Name'
+    tree_name.admin_order_field = 'path'
+
     def product_count(self, obj):
         return obj.products.count()
 
@@ -62,15 +88,39 @@ class CategoryAdmin(admin.ModelAdmin):
 # ---
 
 
+# === Inline для ProductVariant ===
+class ProductVariantInline(admin.TabularInline):
+    model = ProductVariant
+    extra = 0
+    fields = ('sku', 'size', 'color', 'stock')
+
+
+# ---
+
+
+# === Форма товара с загрузкой изображения ===
+class ProductAdminForm(forms.ModelForm):
+    image_upload = forms.ImageField(
+        required=False,
+        help_text='Uploaded image replaces the URL and gets resized variants generated'
+    )
+
+    class Meta:
+        model = Product
+        fields = '__all__'
+
+
 # === Product Admin ===
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
+    inlines = [ProductVariantInline]
     # 'new_price' используется для list_editable
     list_display = ('id', 'name', 'category', 'new_price', 'old_price_display',
-                    'discount_percent', 'image_preview')
+                    'discount_percent', 'stock', 'image_preview')
     list_filter = ('category', 'new_price')
     search_fields = ('name', 'description')
-    list_editable = ('new_price',)
+    list_editable = ('new_price', 'stock')
     list_per_page = 20
     ordering = ('id',)
 
@@ -82,8 +132,11 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('old_price', 'new_price'),
             'classes': ('wide',)
         }),
+        ('Inventory', {
+            'fields': ('stock',)
+        }),
         ('Media', {
-            'fields': ('image',)
+            'fields': ('image', 'image_upload')
         }),
     )
 
@@ -113,7 +166,32 @@ class ProductAdmin(admin.ModelAdmin):
 
     discount_percent.short_description = 'Discount'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+
+        upload = form.cleaned_data.get('image_upload')
+        if upload:
+            path = default_storage.save(f'products/originals/{obj.id}_{upload.name}', upload)
+            obj.image = request.build_absolute_uri(default_storage.url(path))
+            obj.image_variants = build_variants(
+                obj.id,
+                default_storage.path(path),
+                Path(settings.MEDIA_ROOT) / 'products',
+                f'{settings.MEDIA_URL}products/',
+                settings.PRODUCT_IMAGE_WIDTHS,
+                settings.PRODUCT_IMAGE_FORMATS,
+            )
+            # auto_now проставляется, только если updated_at есть в update_fields
+            obj.save(update_fields=['image', 'image_variants', 'updated_at'])
+
     def image_preview(self, obj):
+        if obj.image_variants:
+            # Самый маленький вариант вместо полноразмерного исходника
+            image_url = min(obj.image_variants, key=lambda variant: variant['width'])['url']
+            return format_html(
+                '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 5px;" />',
+                image_url
+            )
         if obj.image:
             image_url = getattr(obj.image, 'url', obj.image)
             return format_html(
@@ -125,26 +203,41 @@ class ProductAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Image'
 
     # === Actions (ИСПРАВЛЕННЫЕ ОПИСАНИЯ для предотвращения TypeError: %d format) ===
+    def apply_discount(self, request, queryset, percent):
+        # Один UPDATE вместо save() на каждый товар; событие в outbox — пачками id
+        with transaction.atomic():
+            previous = dict(queryset.values_list('id', 'new_price'))
+            ids = list(previous)
+            now = timezone.now()
+            Product.objects.filter(id__in=ids).update(
+                new_price=F('old_price') * (Decimal(100 - percent) / 100),
+                updated_at=now,
+            )
+            # История цен — одной вставкой на всё действие, только изменившиеся
+            record_prices(
+                [
+                    (product_id, price)
+                    for product_id, price in Product.objects.filter(id__in=ids).values_list('id', 'new_price')
+                    if to_cents(price) != to_cents(previous[product_id])
+                ],
+                at=now,
+            )
+            emit_many('product.changed', ids)
+            # UPDATE не шлёт post_save — версию каталога поднимаем сами
+            transaction.on_commit(bump_catalog_version)
+        self.message_user(request, f'{len(ids)} products updated with {percent}% discount')
+
     @admin.action(description='Apply 10%% discount to selected products')
     def apply_discount_10(self, request, queryset):
-        for product in queryset:
-            product.new_price = product.old_price * Decimal('0.9')
-            product.save()
-        self.message_user(request, f'{queryset.count()} products updated with 10% discount')
+        self.apply_discount(request, queryset, 10)
 
     @admin.action(description='Apply 20%% discount to selected products')
     def apply_discount_20(self, request, queryset):
-        for product in queryset:
-            product.new_price = product.old_price * Decimal('0.8')
-            product.save()
-        self.message_user(request, f'{queryset.count()} products updated with 20% discount')
+        self.apply_discount(request, queryset, 20)
 
     @admin.action(description='Apply 50%% discount to selected products')
     def apply_discount_50(self, request, queryset):
-        for product in queryset:
-            product.new_price = product.old_price * Decimal('0.5')
-            product.save()
-        self.message_user(request, f'{queryset.count()} products updated with 50% discount')
+        self.apply_discount(request, queryset, 50)
 
 
 # ---
@@ -167,6 +260,19 @@ class CartItemAdmin(admin.ModelAdmin):
 # ---
 
 
+# === StockReservation Admin ===
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'quantity', 'expires_at')
+    list_filter = ('expires_at',)
+    search_fields = ('product__name', 'user__username')
+    list_select_related = ('user', 'product')
+    list_per_page = 20
+
+
+# ---
+
+
 # === Order Admin ===
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -188,7 +294,37 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
-    actions = ['mark_as_pending', 'mark_as_processing', 'mark_as_delivered', 'mark_as_cancelled']
+    actions = ['mark_as_pending', 'mark_as_processing', 'mark_as_delivered', 'mark_as_cancelled',
+               'export_as_csv']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Отменённый заказ не возвращается в работу: остаток уже на складе
+        if obj is not None and obj.status == 'Cancelled':
+            return self.readonly_fields + ('status',)
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        # Смена статуса в форме — как в действиях: отмена возвращает товары на склад
+        new_status = obj.status
+        if change and 'status' in form.changed_data:
+            obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        if obj.status != new_status:
+            set_status(Order.objects.filter(pk=obj.pk), new_status)
+            obj.refresh_from_db(fields=['status'])
+
+    def get_urls(self):
+        urls = [
+            path('export/', self.admin_site.admin_view(self.export_view), name='api_order_export'),
+        ]
+        return urls + super().get_urls()
+
+    def export_view(self, request):
+        """CSV всех заказов, подходящих под текущие фильтры changelist."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        queryset = self.get_changelist_instance(request).get_queryset(request)
+        return streaming_export('csv', ORDER_EXPORT_HEADER, order_export_rows(queryset), 'orders')
 
     def status_display(self, obj):
         colors = {
@@ -225,23 +361,28 @@ class OrderAdmin(admin.ModelAdmin):
     # === Actions ===
     @admin.action(description='Mark as Pending')
     def mark_as_pending(self, request, queryset):
-        queryset.update(status='Pending')
-        self.message_user(request, f'{queryset.count()} orders marked as Pending')
+        changed = set_status(queryset, 'Pending')
+        self.message_user(request, f'{changed} orders marked as Pending')
 
     @admin.action(description='Mark as Processing')
     def mark_as_processing(self, request, queryset):
-        queryset.update(status='Processing')
-        self.message_user(request, f'{queryset.count()} orders marked as Processing')
+        changed = set_status(queryset, 'Processing')
+        self.message_user(request, f'{changed} orders marked as Processing')
 
     @admin.action(description='Mark as Delivered')
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='Delivered')
-        self.message_user(request, f'{queryset.count()} orders marked as Delivered')
+        changed = set_status(queryset, 'Delivered')
+        self.message_user(request, f'{changed} orders marked as Delivered')
+
+    @admin.action(description='Export selected orders to CSV')
+    def export_as_csv(self, request, queryset):
+        return streaming_export('csv', ORDER_EXPORT_HEADER, order_export_rows(queryset), 'orders')
 
     @admin.action(description='Mark as Cancelled')
     def mark_as_cancelled(self, request, queryset):
-        queryset.update(status='Cancelled')
-        self.message_user(request, f'{queryset.count()} orders marked as Cancelled')
+        # Товары возвращаются на склад внутри set_status, один раз на заказ
+        changed = set_status(queryset, 'Cancelled')
+        self.message_user(request, f'{changed} orders marked as Cancelled')
 
 
 # ---
@@ -264,3 +405,62 @@ class OrderItemAdmin(admin.ModelAdmin):
 
     subtotal_display.short_description = 'Subtotal'
 
+
+# ---
+
+
+# === Archived Order Admin ===
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    fields = ('product', 'variant', 'quantity', 'price')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Архив только для просмотра: заказы переносит команда archive_orders."""
+    list_display = ('id', 'user', 'status', 'total', 'created_at', 'archived_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__username', 'user__email')
+    list_select_related = ('user',)
+    ordering = ('-created_at',)
+    list_per_page = 20
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# ---
+
+
+# === Promotion Admin ===
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'value', 'code', 'starts_at', 'ends_at', 'is_active')
+    list_filter = ('kind', 'is_active')
+    search_fields = ('name', 'code')
+    list_editable = ('is_active',)
+    autocomplete_fields = ('products', 'categories')
+    list_per_page = 20
+
+    fieldsets = (
+        ('Rule', {
+            'fields': ('name', 'kind', 'value', 'bundle_quantity', 'code')
+        }),
+        ('Applies to', {
+            'fields': ('products', 'categories'),
+            'description': 'Leave both empty to apply the rule to the whole cart'
+        }),
+        ('Schedule', {
+            'fields': ('starts_at', 'ends_at', 'is_active')
+        }),
+    )
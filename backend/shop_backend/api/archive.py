@@ -0,0 +1,45 @@
+"""
+Перенос старых завершённых заказов в архивные таблицы.
+
+Каждая пачка — отдельная транзакция: копия в ArchivedOrder /
+ArchivedOrderItem (с теми же id) и удаление из Order / OrderItem.
+Прерванный перенос безопасно запускать снова: закоммиченные пачки уже
+ушли из живых таблиц, незакоммиченная откатилась целиком.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+
+ARCHIVE_STATUSES = ('Delivered', 'Cancelled')
+
+ORDER_FIELDS = ('id', 'user_id', 'created_at', 'total', 'discount', 'coupon', 'status')
+ORDER_ITEM_FIELDS = ('id', 'order_id', 'product_id', 'variant_id', 'quantity', 'price')
+
+
+def archivable_orders(days, statuses=ARCHIVE_STATUSES):
+    cutoff = timezone.now() - timedelta(days=days)
+    return Order.objects.filter(created_at__lt=cutoff, status__in=statuses).order_by('id')
+
+
+def archive_batch(queryset, batch_size=500):
+    """Переносит одну пачку заказов из queryset. Возвращает число перенесённых."""
+    with transaction.atomic():
+        orders = list(queryset.select_for_update().values(*ORDER_FIELDS)[:batch_size])
+        if not orders:
+            return 0
+        order_ids = [order['id'] for order in orders]
+        items = OrderItem.objects.filter(order_id__in=order_ids).values(*ORDER_ITEM_FIELDS)
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create(
+            [ArchivedOrderItem(**item) for item in items], batch_size=1000
+        )
+        # Позиции удаляются каскадом; сумму удаляемого заказа их post_delete
+        # не пересчитывает (origin — заказ, см. signals.order_line_deleted)
+        Order.objects.filter(id__in=order_ids).delete()
+    return len(orders)
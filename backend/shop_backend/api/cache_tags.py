@@ -0,0 +1,141 @@
+"""
+Surrogate keys и Cache-Control для общего HTTP-кеша (CDN / reverse proxy).
+
+Ответы каталога помечаются ключами (Surrogate-Key через пробел — Fastly,
+Varnish; Cache-Tag через запятую — Cloudflare):
+
+    catalog            — любой ответ каталога (ручной полный сброс)
+    product-list       — списки товаров: состав, порядок и фасеты меняются
+                         при любом изменении товара
+    product-<id>       — карточка товара и точечные подборки (related, similar);
+                         в них есть имя категории, поэтому событие category.*
+                         сбрасывает и product-<id> всех товаров категории
+    category-list      — список категорий
+    category-<id>      — карточка категории
+
+Сброс выполняет purge_event — обработчик outbox (см. OUTBOX_HANDLERS):
+по событию product.*/category.* он передаёт ровно затронутые ключи
+бэкенду CACHE_PURGE['BACKEND'] (метод purge(keys)).
+
+Остатки событий не порождают: сброс на каждую бронь выбивал бы из кеша
+самые ходовые товары. Их отставание ограничивает короткий s-maxage
+ответов с товарами (CACHE_CONTROL_POLICIES).
+"""
+
+import json
+import logging
+import urllib.request
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_KEY = 'catalog'
+
+
+# === Ключи ===
+def product_key(product_id):
+    return f'product-{product_id}'
+
+
+def category_key(category_id):
+    return f'category-{category_id}'
+
+
+def purge_keys(topic, ids):
+    """Ключи, которые нужно сбросить по событию outbox."""
+    if topic.startswith('product.'):
+        return [product_key(product_id) for product_id in ids] + ['product-list']
+    if topic.startswith('category.'):
+        # В ответах товаров есть имя категории
+        product_ids = Product.objects.filter(category_id__in=ids).values_list('id', flat=True)
+        return (
+            [category_key(category_id) for category_id in ids]
+            + [product_key(product_id) for product_id in product_ids.order_by('id')]
+            + ['category-list', 'product-list']
+        )
+    return []
+
+
+def cache_control_policy(scope, action):
+    policies = settings.CACHE_CONTROL_POLICIES
+    return policies.get(f'{scope}.{action}', policies.get(f'{scope}.*'))
+
+
+class SurrogateKeyMixin:
+    """
+    Ставит Surrogate-Key / Cache-Tag и Cache-Control на успешные GET-ответы
+    ViewSet'а. cache_scope — 'products' / 'categories' (префикс ключей и
+    имя политики в CACHE_CONTROL_POLICIES).
+    """
+    cache_scope = None
+    key_prefix = None
+
+    def surrogate_keys(self, response):
+        if self.detail:
+            return [CATALOG_KEY, f'{self.key_prefix}-{self.kwargs[self.lookup_url_kwarg or self.lookup_field]}']
+        return [CATALOG_KEY, f'{self.key_prefix}-list']
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+
+        policy = cache_control_policy(self.cache_scope, self.action)
+        if policy:
+            response['Cache-Control'] = policy
+        if not response.streaming:
+            keys = list(dict.fromkeys(self.surrogate_keys(response)))
+            response['Surrogate-Key'] = ' '.join(keys)
+            response['Cache-Tag'] = ','.join(keys)
+        return response
+
+
+# === Сброс ===
+class LoggingPurger:
+    """По умолчанию: только пишет ключи в лог (кеша перед API нет)."""
+
+    def purge(self, keys):
+        logger.info('cache purge: %s', ' '.join(keys))
+
+
+class HttpPurger:
+    """
+    POST {"keys": [...]} на url пачками по batch_size ключей — подходит для
+    прокси с purge-эндпоинтом и для локальной заглушки в тестах.
+    Ошибка HTTP бросается наружу: outbox доставит событие повторно.
+    """
+
+    def __init__(self, url, token=None, batch_size=256, timeout=5):
+        self.url = url
+        self.token = token
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+    def purge(self, keys):
+        for start in range(0, len(keys), self.batch_size):
+            body = json.dumps({'keys': keys[start:start + self.batch_size]}).encode()
+            request = urllib.request.Request(self.url, data=body, method='POST')
+            request.add_header('Content-Type', 'application/json')
+            if self.token:
+                request.add_header('Authorization', f'Bearer {self.token}')
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+
+
+@lru_cache(maxsize=None)
+def get_purger():
+    config = settings.CACHE_PURGE
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def purge_event(event):
+    """Обработчик outbox для событий product.* и category.*."""
+    keys = purge_keys(event.topic, event.payload.get('ids', []))
+    if keys:
+        get_purger().purge(keys)
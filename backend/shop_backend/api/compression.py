@@ -0,0 +1,109 @@
+"""
+Сжатие ответов API: gzip и brotli (если установлен пакет brotli).
+
+CompressionMiddleware сжимает ответы API больше COMPRESSION_MIN_SIZE на лету.
+HTML (админка, формы с CSRF-токеном) не сжимается: сжатие страниц с секретом
+рядом с отражённым вводом открывает атаку BREACH.
+Для горячих ответов каталога (см. ProductViewSet.list) в кеше лежат уже
+сжатые байты всех вариантов: повторный запрос не сериализует и не
+сжимает ничего, а только выбирает вариант по Accept-Encoding.
+"""
+
+import gzip
+import hashlib
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSED_PATH_PREFIX = '/api/'
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv', 'application/x-ndjson')
+
+# На лету — быстрые уровни; для кеша сжимаем один раз, поэтому сильнее
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 9
+
+_ACCEPT_RE = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?')
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        match = _ACCEPT_RE.match(part)
+        if match and (match.group(2) is None or float(match.group(2) or 0) > 0):
+            accepted.add(match.group(1).lower())
+    return accepted
+
+
+def preferred_encoding(request):
+    """'br', 'gzip' или None."""
+    accepted = _accepted_encodings(request)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, cached=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=CACHED_GZIP_LEVEL if cached else GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(request, response):
+    """Только данные API: JSON, NDJSON и CSV под /api/."""
+    if not request.path.startswith(COMPRESSED_PATH_PREFIX):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return content_type in COMPRESSIBLE_TYPES
+
+
+# === Кеш сжатых ответов ===
+def precompressed_cache_key(request, version, params):
+    """
+    Ключ кеша сжатого ответа или None, если в запросе есть параметры не из
+    params: иначе любой мусорный ?x=1 создавал бы новую многомегабайтную
+    запись. Параметры в ключе отсортированы — ?a=1&b=2 и ?b=2&a=1 делят запись.
+    """
+    query = request.query_params
+    if any(name not in params for name in query):
+        return None
+    canonical = urlencode(sorted((name, value) for name in query for value in query.getlist(name)))
+    # С хостом: в ответах есть абсолютные URL изображений
+    url = f'{request.build_absolute_uri(request.path)}?{canonical}'
+    return f'precompressed:{version}:{hashlib.sha1(url.encode()).hexdigest()}'
+
+
+def store_precompressed(key, response):
+    """Сохраняет отрендеренный ответ в кеше в виде всех вариантов сжатия."""
+    content = response.rendered_content
+    entry = {
+        'content_type': response['Content-Type'],
+        'identity': content,
+        'gzip': compress(content, 'gzip', cached=True),
+        'br': compress(content, 'br', cached=True) if brotli is not None else None,
+    }
+    cache.set(key, entry, settings.PRECOMPRESSED_CACHE_TIMEOUT)
+    return entry
+
+
+def precompressed_response(request, entry):
+    encoding = preferred_encoding(request)
+    body = entry.get(encoding) if encoding else None
+    response = HttpResponse(body or entry['identity'], content_type=entry['content_type'])
+    if body:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
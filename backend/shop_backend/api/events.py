@@ -0,0 +1,191 @@
+"""
+События о смене статуса заказа и их поток для покупателя (SSE).
+
+Смены статуса пишутся в outbox (в той же транзакции) и после коммита
+публикуются в брокер ORDER_EVENTS_BROKER, канал — пользователь-владелец заказа.
+/api/orders/events/ держит одно соединение text/event-stream и отдаёт:
+при подключении — текущие статусы незавершённых заказов (snapshot),
+дальше — каждую смену статуса (order_status) и keepalive-комментарии.
+
+InProcessBroker раздаёт события только подписчикам своего процесса —
+этого хватает для одного ASGI-процесса (uvicorn/daphne). Для нескольких
+процессов подставьте брокер с тем же интерфейсом поверх общего
+транспорта (например, Redis pub/sub):
+
+    subscribe(channel) -> async context manager с методом
+                          async get(timeout), бросающим asyncio.TimeoutError
+    publish(channel, event) — синхронный, вызывается из любого потока
+
+Поток SSE требует ASGI-сервера: под WSGI (runserver) соединение заняло
+бы рабочий поток целиком, поэтому там /api/orders/events/ отвечает 501 и
+клиент остаётся на опросе /api/orders/. Одно соединение живёт не дольше
+ORDER_EVENTS_MAX_DURATION, затем EventSource переподключается сам
+(с новым snapshot).
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .inventory import restock_orders
+from .models import Order
+from .outbox import emit_many
+
+
+TERMINAL_STATUSES = ('Delivered', 'Cancelled')
+
+
+# === Брокер ===
+def _put_latest(queue, event):
+    # Медленный клиент: теряем самое старое событие, а не блокируем издателя
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class _Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=broker.queue_size)
+
+    async def __aenter__(self):
+        self.target = (asyncio.get_running_loop(), self.queue)
+        with self.broker.lock:
+            self.broker.subscribers[self.channel].add(self.target)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        with self.broker.lock:
+            targets = self.broker.subscribers[self.channel]
+            targets.discard(self.target)
+            if not targets:
+                del self.broker.subscribers[self.channel]
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InProcessBroker:
+    """Pub/sub в памяти процесса: канал -> очереди подписчиков."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        return _Subscription(self, channel)
+
+    def publish(self, channel, event):
+        with self.lock:
+            targets = list(self.subscribers.get(channel, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(_put_latest, queue, event)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                pass
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.ORDER_EVENTS_BROKER)()
+
+
+# === Смена статуса заказов ===
+def user_channel(user_id):
+    return f'orders:user:{user_id}'
+
+
+def publish_status_changes(changes):
+    """
+    changes — [(order_id, user_id, status)]. Вызывать внутри транзакции
+    смены статуса: событие outbox пишется в ней же, SSE — после коммита.
+    """
+    if not changes:
+        return
+    at = timezone.now().isoformat()
+
+    by_status = defaultdict(list)
+    for order_id, _, status in changes:
+        by_status[status].append(order_id)
+    for status, order_ids in by_status.items():
+        emit_many('order.status_changed', order_ids, status=status)
+
+    def send():
+        broker = get_broker()
+        for order_id, user_id, status in changes:
+            broker.publish(user_channel(user_id), {'order_id': order_id, 'status': status, 'at': at})
+
+    transaction.on_commit(send)
+
+
+def set_status(queryset, status):
+    """
+    Меняет статус заказов и публикует переходы. Возвращает число
+    изменённых заказов.
+
+    Отменённый заказ больше не меняет статус: его товары уже вернулись на
+    склад. Отмена возвращает товары в той же транзакции и только для
+    заказов, которые перевёл в Cancelled именно этот вызов: каждый заказ —
+    условным UPDATE ... WHERE status <> 'Cancelled', поэтому две
+    параллельные отмены не вернут остаток дважды.
+    """
+    with transaction.atomic():
+        changed = list(
+            queryset.exclude(status=status)
+            .exclude(status='Cancelled')
+            .select_for_update()
+            .values_list('id', 'user_id')
+        )
+        if status == 'Cancelled':
+            changed = [
+                (order_id, user_id) for order_id, user_id in changed
+                if Order.objects.filter(id=order_id).exclude(status='Cancelled').update(status=status)
+            ]
+            restock_orders([order_id for order_id, _ in changed])
+        else:
+            Order.objects.filter(id__in=[order_id for order_id, _ in changed]).update(status=status)
+        publish_status_changes([(order_id, user_id, status) for order_id, user_id in changed])
+    return len(changed)
+
+
+# === Поток SSE ===
+_event_ids = itertools.count(1)
+
+
+def _sse(event_type, data):
+    return f'id: {next(_event_ids)}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+async def order_event_stream(user_id):
+    # Подписываемся до snapshot, чтобы не пропустить смену статуса между ними
+    async with get_broker().subscribe(user_channel(user_id)) as subscription:
+        active = await sync_to_async(list)(
+            Order.objects.filter(user_id=user_id)
+            .exclude(status__in=TERMINAL_STATUSES)
+            .order_by('-created_at', '-id')
+            .values_list('id', 'status')
+        )
+        yield f'retry: {settings.ORDER_EVENTS_HEARTBEAT * 1000}\n\n'
+        yield _sse('snapshot', [{'order_id': order_id, 'status': status} for order_id, status in active])
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.ORDER_EVENTS_MAX_DURATION
+        while (left := deadline - loop.time()) > 0:
+            try:
+                event = await subscription.get(min(settings.ORDER_EVENTS_HEARTBEAT, left))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield _sse('order_status', event)
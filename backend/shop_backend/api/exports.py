@@ -0,0 +1,97 @@
+"""
+Потоковые выгрузки в CSV и NDJSON.
+
+Строки читаются из БД чанками (.iterator(chunk_size=...)) и сразу уходят
+клиенту через StreamingHttpResponse, поэтому память не растёт с размером выборки.
+"""
+
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from .models import OrderItem
+
+
+EXPORT_CHUNK_SIZE = 2000
+# Заказы тянут за собой позиции, товары и пользователей — чанк меньше
+ORDER_EXPORT_CHUNK_SIZE = 500
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: write() возвращает строку, а не пишет её."""
+
+    def write(self, value):
+        return value
+
+
+def _to_json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(
+            {name: _to_json_value(value) for name, value in zip(header, row)},
+            ensure_ascii=False
+        ) + '\n'
+
+
+def streaming_export(export_type, header, rows, filename):
+    """rows — итератор кортежей в порядке header."""
+    lines = csv_lines(header, rows) if export_type == 'csv' else ndjson_lines(header, rows)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_type])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_type}"'
+    return response
+
+
+ORDER_EXPORT_HEADER = [
+    'order_id', 'created_at', 'username', 'email', 'status', 'order_total',
+    'product_id', 'product_name', 'sku', 'quantity', 'unit_price', 'subtotal',
+]
+
+
+def order_export_rows(orders):
+    """
+    Строки выгрузки заказов: по одной на позицию заказа.
+    Позиции подгружаются prefetch'ем на каждый чанк итератора.
+    """
+    orders = (
+        orders.select_related('user')
+        .prefetch_related(Prefetch(
+            'order_items',
+            queryset=OrderItem.objects.select_related('product', 'variant').order_by('id')
+        ))
+        .order_by('id')
+        .iterator(chunk_size=ORDER_EXPORT_CHUNK_SIZE)
+    )
+    for order in orders:
+        head = [order.id, order.created_at.isoformat(), order.user.username,
+                order.user.email, order.status, order.total]
+        items = order.order_items.all()
+        if not items:
+            yield head + [''] * 6
+        for item in items:
+            yield head + [
+                item.product_id, item.product.name, item.variant.sku if item.variant else '',
+                item.quantity, item.price, item.subtotal(),
+            ]
@@ -0,0 +1,161 @@
+"""
+Sparse fieldsets и раскрытие вложенных объектов: ?fields= / ?expand=
+
+    ?fields=id,name,new_price
+    ?fields=id,total,order_items.quantity,order_items.product.name
+    ?expand=user,order_items,order_items.product
+
+Без параметров ответ не меняется. Если передан хотя бы один из параметров,
+вложенные объекты, не перечисленные в expand (и не выбранные через
+вложенный путь в fields), отдаются как первичные ключи.
+Запрос к БД подстраивается под выбранные поля (см. optimize_queryset).
+"""
+
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def parse_fields(value):
+    """'id,order_items.product.name' -> {'id': {}, 'order_items': {'product': {'name': {}}}}"""
+    tree = {}
+    for path in value.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        node = tree
+        for part in path.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _nested_serializer(field):
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+def prune_fields(serializer, spec, expand, prefix=''):
+    """
+    Убирает невыбранные поля и сворачивает нераскрытые вложенные объекты в id.
+    spec=None означает «все поля этого уровня».
+    """
+    for name in list(serializer.fields):
+        if spec and name not in spec:
+            serializer.fields.pop(name)
+            continue
+
+        field = serializer.fields[name]
+        nested = _nested_serializer(field)
+        if nested is None:
+            continue
+
+        path = f'{prefix}{name}'
+        sub_spec = spec.get(name) if spec else None
+        if path not in expand and not sub_spec:
+            kwargs = {'source': field.source} if field.source != name else {}
+            serializer.fields[name] = serializers.PrimaryKeyRelatedField(
+                many=isinstance(field, serializers.ListSerializer),
+                read_only=True,
+                **kwargs
+            )
+            continue
+
+        prune_fields(nested, sub_spec or None, expand, prefix=f'{path}.')
+
+
+class DynamicFieldsMixin:
+    """Применяет ?fields= / ?expand= из запроса к корневому сериализатору."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+
+        fields = request.query_params.get('fields')
+        expand = request.query_params.get('expand')
+        if fields is None and expand is None:
+            return
+
+        expand_paths = {path.strip() for path in (expand or '').split(',') if path.strip()}
+        prune_fields(self, parse_fields(fields or '') or None, expand_paths)
+
+
+def sparse_fields_requested(request):
+    params = request.query_params
+    return request.method == 'GET' and ('fields' in params or 'expand' in params)
+
+
+def _model_paths(serializer, field, model):
+    """Поля модели, которые нужны для отрисовки одного поля сериализатора."""
+    sources = getattr(serializer.Meta, 'sparse_field_sources', {})
+    if field.field_name in sources:
+        return sources[field.field_name]
+    if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+        return []
+    # Методы модели (subtotal и т.п.) без описания в sparse_field_sources
+    # пропускаем: only() их не знает
+    model_field_names = {model_field.name for model_field in model._meta.concrete_fields}
+    if field.source_attrs[0] not in model_field_names:
+        return []
+    return ['__'.join(field.source_attrs)]
+
+
+def optimize_queryset(queryset, serializer, extra_only=()):
+    """
+    Строит only()/select_related()/prefetch_related() по уже урезанному
+    сериализатору: тянем из БД ровно то, что попадёт в ответ.
+    """
+    only, select, prefetch = _collect(serializer, queryset.model)
+    queryset = queryset.select_related(None).prefetch_related(None).only(*only, *extra_only)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _collect(serializer, model):
+    """Возвращает (only, select_related, prefetch_related) относительно model."""
+    only, select, prefetch = [model._meta.pk.name], [], []
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            # Обратная связь (order_items): отдельный prefetch со своим only()
+            relation = model._meta.get_field(field.source)
+            child_qs = optimize_queryset(
+                relation.related_model.objects.all(), field.child,
+                extra_only=[relation.field.name]
+            )
+            prefetch.append(Prefetch(field.source, queryset=child_qs))
+        elif isinstance(field, serializers.BaseSerializer):
+            # Прямой FK (user, product): JOIN через select_related
+            related_model = model._meta.get_field(field.source).related_model
+            sub_only, sub_select, sub_prefetch = _collect(field, related_model)
+            only.extend(f'{field.source}__{path}' for path in sub_only)
+            select.append(field.source)
+            select.extend(f'{field.source}__{path}' for path in sub_select)
+            prefetch.extend(
+                Prefetch(f'{field.source}__{item.prefetch_through}', queryset=item.queryset)
+                for item in sub_prefetch
+            )
+        elif isinstance(field, serializers.ManyRelatedField):
+            # Свёрнутый в список id обратный набор
+            relation = model._meta.get_field(field.source)
+            prefetch.append(Prefetch(
+                field.source,
+                queryset=relation.related_model.objects.only('pk', relation.field.name)
+            ))
+        else:
+            for path in _model_paths(serializer, field, model):
+                only.append(path)
+                if '__' in path:
+                    select.append(path.rsplit('__', 1)[0])
+
+    return only, select, prefetch
@@ -0,0 +1,123 @@
+"""
+Фильтры каталога и счётчики фасетов для боковой панели.
+
+Каждый фасет считается одним GROUP BY запросом по выборке, к которой
+применены все фильтры, кроме фильтров самого фасета: так в панели видно,
+сколько товаров будет, если выбрать другую категорию или другой диапазон цен.
+"""
+
+from decimal import Decimal
+
+import django_filters
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import NullIf
+
+from .models import PATH_SEP, Category, Product, subtree_q
+
+
+# Диапазоны фасетов: (from, to), to=None — без верхней границы
+PRICE_BUCKETS = [(0, 50), (50, 100), (100, 200), (200, None)]
+DISCOUNT_BUCKETS = [(0, 10), (10, 30), (30, 50), (50, None)]
+
+
+def with_discount(queryset):
+    """Аннотация discount — скидка в процентах от old_price."""
+    return queryset.annotate(discount=ExpressionWrapper(
+        (F('old_price') - F('new_price')) * Decimal('100') / NullIf(F('old_price'), Decimal('0')),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class ProductFilter(django_filters.FilterSet):
+    # Категория включает всё своё поддерево (Women -> Tops -> Blouses)
+    category = django_filters.ModelChoiceFilter(queryset=Category.objects.all(), method='filter_category')
+    category__name = django_filters.CharFilter(method='filter_category_name')
+    min_price = django_filters.NumberFilter(field_name='new_price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='new_price', lookup_expr='lte')
+    min_discount = django_filters.NumberFilter(method='filter_discount')
+    max_discount = django_filters.NumberFilter(method='filter_discount')
+
+    # Параметры, которые относятся к каждому фасету
+    FACET_PARAMS = {
+        'category': ['category', 'category__name'],
+        'price': ['min_price', 'max_price'],
+        'discount': ['min_discount', 'max_discount'],
+    }
+
+    class Meta:
+        model = Product
+        fields = ['category', 'category__name']
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(subtree_q(value.path, prefix='category__'))
+    
+    def filter_category_name(self, queryset, name, value):
+        path = Category.objects.filter(name=value).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        return queryset.filter(subtree_q(path, prefix='category__'))
+    
+    def filter_discount(self, queryset, name, value):
+        if 'discount' not in queryset.query.annotations:
+            queryset = with_discount(queryset)
+        lookup = 'gte' if name == 'min_discount' else 'lte'
+        return queryset.filter(**{f'discount__{lookup}': value})
+
+
+def _bucket_case(expression, buckets):
+    whens = []
+    for low, high in buckets:
+        label = f'{low}-{high}' if high is not None else f'{low}+'
+        condition = {f'{expression}__gte': low}
+        if high is not None:
+            condition[f'{expression}__lt'] = high
+        whens.append(When(then=Value(label), **condition))
+    return Case(*whens, default=Value(None))
+
+
+def _bucket_counts(queryset, expression, buckets):
+    rows = (
+        queryset.order_by()
+        .annotate(bucket=_bucket_case(expression, buckets))
+        .values('bucket')
+        .annotate(count=Count('id'))
+    )
+    counts = {row['bucket']: row['count'] for row in rows}
+    result = []
+    for low, high in buckets:
+        label = f'{low}-{high}' if high is not None else f'{low}+'
+        result.append({'from': low, 'to': high, 'label': label, 'count': counts.get(label, 0)})
+    return result
+
+
+def _category_counts(queryset):
+    """
+    Счётчики категорий с учётом подкатегорий — как фильтрует ?category=
+    (subtree_q): товар засчитывается своей категории и всем её предкам по path.
+    """
+    counts = {}
+    rows = queryset.order_by().values_list('category__path').annotate(count=Count('id'))
+    for path, count in rows:
+        for category_id in path.split(PATH_SEP)[:-1]:
+            counts[int(category_id)] = counts.get(int(category_id), 0) + count
+
+    categories = Category.objects.filter(id__in=counts).values_list('id', 'name', 'parent_id')
+    return sorted(
+        (
+            {'id': category_id, 'name': name, 'parent': parent_id, 'count': counts[category_id]}
+            for category_id, name, parent_id in categories
+        ),
+        key=lambda row: row['name'],
+    )
+
+
+def product_facets(filtered_for):
+    """
+    filtered_for(facet) -> queryset со всеми фильтрами, кроме фильтров facet.
+    Возвращает {'category': [...], 'price': [...], 'discount': [...]} — четыре запроса.
+    """
+    return {
+        'category': _category_counts(filtered_for('category')),
+        'price': _bucket_counts(filtered_for('price'), 'new_price', PRICE_BUCKETS),
+        'discount': _bucket_counts(with_discount(filtered_for('discount')), 'discount', DISCOUNT_BUCKETS),
+    }
@@ -0,0 +1,134 @@
+"""
+Корзина анонимного посетителя.
+
+Содержимое лежит в кеше под случайным id, сам id — в подписанной cookie.
+Просмотр и изменение гостевой корзины не пишут в БД (в т.ч. не создают
+сессию). При логине/регистрации корзина переносится в CartItem пачкой.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .inventory import OutOfStock, sync_reservation
+from .models import CartItem, Product, ProductVariant
+
+
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'api.guest_cart'
+
+
+def _line_key(product_id, variant_id):
+    return f'{product_id}:{variant_id or ""}'
+
+
+def _parse_key(key):
+    product_id, variant_id = key.split(':')
+    return int(product_id), int(variant_id) if variant_id else None
+
+
+class GuestCart:
+    def __init__(self, request):
+        self.cart_id = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        # {'<product_id>:<variant_id>': quantity}
+        self.lines = cache.get(self.cache_key, {}) if self.cart_id else {}
+
+    @property
+    def cache_key(self):
+        return f'guest_cart:{self.cart_id}'
+
+    def quantity(self, product_id, variant_id=None):
+        return self.lines.get(_line_key(product_id, variant_id), 0)
+
+    def set(self, product_id, variant_id, quantity):
+        key = _line_key(product_id, variant_id)
+        if quantity > 0:
+            self.lines[key] = quantity
+        else:
+            self.lines.pop(key, None)
+
+    def clear(self):
+        self.lines = {}
+
+    def save(self, response):
+        if not self.cart_id:
+            self.cart_id = uuid.uuid4().hex
+        cache.set(self.cache_key, self.lines, settings.GUEST_CART_TTL)
+        response.set_signed_cookie(
+            COOKIE_NAME, self.cart_id, salt=COOKIE_SALT,
+            max_age=settings.GUEST_CART_TTL, httponly=True, samesite='Lax'
+        )
+
+    def discard(self, response):
+        if self.cart_id:
+            cache.delete(self.cache_key)
+        response.delete_cookie(COOKIE_NAME, samesite='Lax')
+
+    def cart_items(self):
+        """Несохранённые CartItem для сериализации — товары одним запросом."""
+        keys = [_parse_key(key) for key in self.lines]
+        products = (
+            Product.objects.select_related('category').prefetch_related('variants')
+            .in_bulk({pid for pid, _ in keys})
+        )
+        variants = ProductVariant.objects.in_bulk({vid for _, vid in keys if vid})
+
+        items = []
+        for (product_id, variant_id), quantity in zip(keys, self.lines.values()):
+            if product_id not in products:
+                continue
+            items.append(CartItem(
+                product=products[product_id],
+                variant=variants.get(variant_id),
+                quantity=quantity,
+            ))
+        return items
+
+    def merge_into(self, user):
+        """
+        Переносит гостевую корзину в CartItem пользователя: количества
+        складываются с уже лежащими в корзине, запись — одним bulk_update
+        и одним bulk_create.
+        """
+        if not self.lines:
+            return
+
+        lines = {_parse_key(key): quantity for key, quantity in self.lines.items()}
+        product_ids = set(Product.objects.filter(
+            id__in={pid for pid, _ in lines}
+        ).values_list('id', flat=True))
+
+        with transaction.atomic():
+            existing = {
+                (item.product_id, item.variant_id): item
+                for item in CartItem.objects.select_for_update().filter(user=user)
+            }
+            to_update, to_create = [], []
+            now = timezone.now()
+            for (product_id, variant_id), quantity in lines.items():
+                if product_id not in product_ids:
+                    continue
+                item = existing.get((product_id, variant_id))
+                if item:
+                    item.quantity += quantity
+                    # bulk_update не заполняет auto_now
+                    item.updated_at = now
+                    to_update.append(item)
+                else:
+                    to_create.append(CartItem(
+                        user=user, product_id=product_id, variant_id=variant_id, quantity=quantity
+                    ))
+
+            CartItem.objects.bulk_update(to_update, ['quantity', 'updated_at'])
+            CartItem.objects.bulk_create(to_create)
+
+        # Бронируем остатки под перенесённые строки; если не хватает —
+        # строка остаётся без брони, нехватку поймает оформление заказа
+        for item in to_update + to_create:
+            try:
+                sync_reservation(user, item.product_id, item.quantity, variant_id=item.variant_id)
+            except OutOfStock:
+                pass
@@ -0,0 +1,119 @@
+"""
+Idempotency-Key для оформления заказа и изменений корзины.
+
+Клиент передаёт заголовок Idempotency-Key (например, UUID на каждое
+нажатие кнопки). Первый ответ сохраняется в кеше на IDEMPOTENCY_TTL,
+повтор с тем же ключом получает его из кеша без повторного выполнения.
+Пока первый запрос ещё выполняется, дубликат ждёт его результата
+(до WAIT_TIMEOUT секунд), а не запускает оформление второй раз.
+
+Ключ привязан к пользователю (для гостя — к IP), методу и пути.
+Повтор ключа с другим телом запроса — ошибка 422.
+"""
+
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Сколько дубликат ждёт результата первого запроса, секунд
+WAIT_TIMEOUT = 5
+POLL_INTERVAL = 0.05
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _cache_key(request, key):
+    if request.user.is_authenticated:
+        owner = f'user:{request.user.pk}'
+    else:
+        owner = f'anon:{BaseThrottle().get_ident(request)}'
+    return 'idempotency:' + _digest(f'{owner}:{request.method}:{request.path}:{key}')
+
+
+def _fingerprint(request):
+    return _digest(json.dumps(request.data, sort_keys=True, default=str))
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response(
+            {'error': f'{HEADER} was already used with a different request body'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(stored['data'], status=stored['status'])
+    response[REPLAYED_HEADER] = 'true'
+    # Куки гостевой корзины: первый ответ мог не дойти до клиента
+    response.cookies = stored['cookies']
+    return response
+
+
+def idempotent(view_method):
+    """Декоратор метода ViewSet. Без заголовка запрос выполняется как обычно."""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} is too long'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = _cache_key(request, key)
+        lock_key = f'{cache_key}:lock'
+        fingerprint = _fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        if not cache.add(lock_key, 1, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            # Запрос с этим ключом уже выполняется — ждём его ответ
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                stored = cache.get(cache_key)
+                if stored is not None:
+                    return _replay(stored, fingerprint)
+            return Response(
+                {'error': f'A request with this {HEADER} is still in progress'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            # Первый запрос мог сохранить ответ и снять блокировку между
+            # нашей проверкой кеша и cache.add — тогда только повторяем ответ
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            response = view_method(self, request, *args, **kwargs)
+            # Ошибки сервера не запоминаем: повтор должен выполниться заново
+            if response.status_code < 500:
+                cache.set(cache_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                    'cookies': response.cookies,
+                }, settings.IDEMPOTENCY_TTL)
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    return wrapper
@@ -0,0 +1,122 @@
+"""
+Пайплайн изображений товаров: из исходника (PNG из Ecommerce_Frontend_Assets
+или загруженного через админку файла) строятся уменьшенные WebP/JPEG варианты.
+
+Варианты пишутся в MEDIA_ROOT/products/<id>/<width>.<ext>, их описание
+хранится в Product.image_variants и отдаётся API как srcset.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db.models.functions import Now
+from PIL import Image
+
+
+FORMAT_EXTENSIONS = {
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+
+def build_variants(product_id, source_path, output_dir, base_url, widths, formats):
+    """
+    Строит варианты одного изображения. Не использует ORM,
+    поэтому безопасно выполняется в дочернем процессе.
+    """
+    variants = []
+    product_dir = Path(output_dir) / str(product_id)
+    product_dir.mkdir(parents=True, exist_ok=True)
+
+    with Image.open(source_path) as original:
+        original.load()
+        # Исходник меньше запрошенной ширины не растягиваем
+        target_widths = sorted({min(width, original.width) for width in widths})
+
+        for width in target_widths:
+            height = round(original.height * width / original.width)
+            resized = original.resize((width, height), Image.LANCZOS)
+
+            for fmt in formats:
+                image = resized
+                if fmt == 'jpeg' and image.mode != 'RGB':
+                    # JPEG без альфа-канала: заливаем прозрачность белым
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+                    image = background
+
+                filename = f'{width}.{FORMAT_EXTENSIONS[fmt]}'
+                image.save(product_dir / filename, fmt.upper(), quality=80, optimize=True)
+
+                variants.append({
+                    'url': f'{base_url}{product_id}/{filename}',
+                    'width': width,
+                    'format': fmt,
+                })
+
+    return variants
+
+
+def _build_variants_task(args):
+    return build_variants(*args)
+
+
+def source_path_for(product, source_dir):
+    """Ищет исходник по имени файла из Product.image (product_N.png)."""
+    if not product.image:
+        return None
+    filename = os.path.basename(urlparse(product.image).path)
+    path = Path(source_dir) / filename
+    return path if path.exists() else None
+
+
+def process_products(products, source_dir, workers=None):
+    """
+    Строит варианты для списка товаров в пуле процессов
+    и сохраняет их одним bulk_update. Возвращает число обработанных товаров.
+    """
+    from .models import Product
+
+    output_dir = Path(settings.MEDIA_ROOT) / 'products'
+    base_url = f'{settings.MEDIA_URL}products/'
+
+    jobs = []
+    for product in products:
+        source_path = source_path_for(product, source_dir)
+        if source_path is not None:
+            jobs.append((product, source_path))
+
+    if not jobs:
+        return 0
+
+    tasks = [
+        (product.id, str(source_path), str(output_dir), base_url,
+         settings.PRODUCT_IMAGE_WIDTHS, settings.PRODUCT_IMAGE_FORMATS)
+        for product, source_path in jobs
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_build_variants_task, tasks))
+
+    updated = []
+    for (product, _), variants in zip(jobs, results):
+        product.image_variants = variants
+        # bulk_update не заполняет auto_now, а без него выгрузка ?since= не увидит правку
+        product.updated_at = Now()
+        updated.append(product)
+
+    Product.objects.bulk_update(updated, ['image_variants', 'updated_at'], batch_size=500)
+    return len(updated)
+
+
+def build_srcset(variants, fmt, build_url=None):
+    """'url 160w, url 320w' для одного формата."""
+    entries = []
+    for variant in variants:
+        if variant['format'] != fmt:
+            continue
+        url = build_url(variant['url']) if build_url else variant['url']
+        entries.append(f"{url} {variant['width']}w")
+    return ', '.join(entries)
@@ -0,0 +1,198 @@
+"""
+Остатки и брони товаров.
+
+Остаток хранится на варианте (ProductVariant.stock), а для товаров без
+вариантов — на самом товаре (Product.stock). Строка корзины держит бронь
+(StockReservation): её единицы уже списаны условным
+UPDATE ... WHERE stock >= qty, поэтому продать больше, чем есть, нельзя.
+При оформлении заказа бронь превращается в продажу, недостающие единицы
+списываются тем же условным UPDATE в порядке id товара — две
+параллельные корзины блокируют строки в одном порядке и не дедлочат друг друга.
+
+Позиции везде адресуются ключом (product_id, variant_id), variant_id может быть None.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import OrderItem, Product, ProductVariant, StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = sorted(set(product_ids))
+        super().__init__(f'Not enough stock for products {self.product_ids}')
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+
+
+def _lock_order(key):
+    product_id, variant_id = key
+    return product_id, variant_id or 0
+
+
+def _take(key, quantity):
+    """Условное списание: False, если остатка не хватает."""
+    product_id, variant_id = key
+    if variant_id:
+        return ProductVariant.objects.filter(pk=variant_id, stock__gte=quantity).update(
+            stock=F('stock') - quantity
+        ) == 1
+    # updated_at — чтобы остаток попал в выгрузку каталога ?since=
+    return Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F('stock') - quantity, updated_at=Now()
+    ) == 1
+
+
+def _put_back(quantities):
+    """Возврат остатков: не больше одного UPDATE на таблицу. {key: quantity}."""
+    products, variants = {}, {}
+    for (product_id, variant_id), quantity in quantities.items():
+        if variant_id:
+            variants[variant_id] = variants.get(variant_id, 0) + quantity
+        else:
+            products[product_id] = products.get(product_id, 0) + quantity
+
+    for model, amounts, extra in (
+        (Product, products, {'updated_at': Now()}),
+        (ProductVariant, variants, {}),
+    ):
+        if not amounts:
+            continue
+        model.objects.filter(pk__in=amounts).update(stock=F('stock') + Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in amounts.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ), **extra)
+
+
+def sync_reservation(user, product_id, quantity, variant_id=None, release_only=False):
+    """
+    Подгоняет бронь пользователя под количество позиции в корзине.
+    Бросает OutOfStock, если добрать недостающее не получилось.
+
+    release_only — для уменьшения позиции: бронь только отпускается и
+    никогда не добирается (если она истекла, остаётся min(бронь, quantity)).
+    """
+    key = (product_id, variant_id)
+    with transaction.atomic():
+        reservation = (
+            StockReservation.objects.select_for_update()
+            .filter(user=user, product_id=product_id, variant_id=variant_id)
+            .first()
+        )
+        held = reservation.quantity if reservation else 0
+        if release_only:
+            quantity = min(quantity, held)
+        delta = quantity - held
+
+        if delta > 0 and not _take(key, delta):
+            raise OutOfStock([product_id])
+        if delta < 0:
+            _put_back({key: -delta})
+
+        if quantity <= 0:
+            if reservation:
+                reservation.delete()
+            return
+
+        if reservation:
+            reservation.quantity = quantity
+            reservation.expires_at = _expiry()
+            reservation.save(update_fields=['quantity', 'expires_at'])
+        else:
+            StockReservation.objects.create(
+                user=user, product_id=product_id, variant_id=variant_id,
+                quantity=quantity, expires_at=_expiry()
+            )
+
+
+def release_user_reservations(user):
+    """Снимает все брони пользователя (очистка корзины)."""
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update()
+            .filter(user=user)
+            .values_list('id', 'product_id', 'variant_id', 'quantity')
+        )
+        _release(reservations)
+
+
+def commit_cart(user, quantities):
+    """
+    Списывает остатки под заказ: {(product_id, variant_id): quantity}.
+    Вызывается внутри транзакции оформления заказа; при нехватке
+    бросает OutOfStock, и вся транзакция откатывается.
+    """
+    held = {
+        (product_id, variant_id): quantity
+        for product_id, variant_id, quantity in (
+            StockReservation.objects.select_for_update()
+            .filter(user=user)
+            .values_list('product_id', 'variant_id', 'quantity')
+        )
+    }
+
+    missing = []
+    surplus = defaultdict(int)
+    # Детерминированный порядок блокировок: по возрастанию id товара
+    for key in sorted(quantities, key=_lock_order):
+        needed = quantities[key] - held.pop(key, 0)
+        if needed > 0 and not _take(key, needed):
+            missing.append(key[0])
+        elif needed < 0:
+            surplus[key] += -needed
+
+    if missing:
+        raise OutOfStock(missing)
+
+    # Брони на позиции, которых уже нет в корзине, возвращаем на склад
+    for key, quantity in held.items():
+        surplus[key] += quantity
+    _put_back(surplus)
+
+    StockReservation.objects.filter(user=user).delete()
+
+
+def restock_orders(order_ids):
+    """Возвращает на склад товары отменённых заказов."""
+    quantities = defaultdict(int)
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        'product_id', 'variant_id', 'quantity'
+    )
+    for product_id, variant_id, quantity in items:
+        quantities[(product_id, variant_id)] += quantity
+    _put_back(quantities)
+
+
+def release_expired(batch_size=500, now=None):
+    """
+    Снимает одну пачку просроченных броней. Возвращает число снятых.
+    Команда release_expired_reservations вызывает её в цикле.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=now)
+            .order_by('id')
+            .values_list('id', 'product_id', 'variant_id', 'quantity')[:batch_size]
+        )
+        _release(reservations)
+    return len(reservations)
+
+
+def _release(reservations):
+    quantities = defaultdict(int)
+    for _, product_id, variant_id, quantity in reservations:
+        quantities[(product_id, variant_id)] += quantity
+    StockReservation.objects.filter(id__in=[row[0] for row in reservations]).delete()
+    _put_back(quantities)
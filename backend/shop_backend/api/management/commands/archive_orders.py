@@ -0,0 +1,41 @@
+"""
+Management команда для переноса старых заказов в архив
+
+Переносит заказы старше --days в статусах Delivered/Cancelled в
+ArchivedOrder / ArchivedOrderItem пачками; каждая пачка — отдельная
+транзакция, прерванный запуск можно просто повторить.
+
+Запуск: python manage.py archive_orders [--days 365] [--batch-size 500] [--pause 0.1]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from api.archive import ARCHIVE_STATUSES, archivable_orders, archive_batch
+
+
+class Command(BaseCommand):
+    help = 'Move old delivered/cancelled orders to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Archive orders older than this')
+        parser.add_argument('--statuses', nargs='+', default=list(ARCHIVE_STATUSES),
+                            help='Only orders in these statuses')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        queryset = archivable_orders(options['days'], options['statuses'])
+        archived = 0
+
+        while True:
+            count = archive_batch(queryset, batch_size=options['batch_size'])
+            archived += count
+            if count < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Archived {archived} orders')
+        )
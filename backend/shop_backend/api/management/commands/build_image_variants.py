@@ -0,0 +1,36 @@
+"""
+Management команда для генерации уменьшенных изображений товаров
+
+Исходники берутся из PRODUCT_IMAGE_SOURCE_DIR (по умолчанию
+Ecommerce_Frontend_Assets/Assets) по имени файла из Product.image.
+
+Запуск: python manage.py build_image_variants [--source DIR] [--ids 1 2 3]
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.images import process_products
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG image variants for products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.PRODUCT_IMAGE_SOURCE_DIR),
+                            help='Directory with original product images')
+        parser.add_argument('--ids', nargs='*', type=int, help='Only these product ids')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Resizing processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        products = Product.objects.only('id', 'image').order_by('id')
+        if options['ids']:
+            products = products.filter(id__in=options['ids'])
+
+        products = list(products)
+        processed = process_products(products, options['source'], workers=options['workers'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Built image variants for {processed} of {len(products)} products')
+        )
@@ -0,0 +1,34 @@
+"""
+Management команда для подсчёта совместных покупок («с этим товаром покупают»)
+
+Учитываются только заказы, появившиеся после прошлого запуска (кроме
+оформленных за последние минуты — см. SAFETY_LAG в api/recommendations.py);
+каждая пачка заказов — отдельная транзакция, прерванный запуск можно повторить.
+
+Запуск: python manage.py build_related_products [--chunk-size 5000] [--rebuild]
+"""
+
+from django.core.management.base import BaseCommand
+from api.recommendations import MAX_ORDER_LINES, build_cooccurrence
+
+
+class Command(BaseCommand):
+    help = 'Update product co-purchase counts from new orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Orders per transaction')
+        parser.add_argument('--max-lines', type=int, default=MAX_ORDER_LINES,
+                            help='Order lines counted per order')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop existing counts and recount all orders')
+
+    def handle(self, *args, **options):
+        processed = build_cooccurrence(
+            chunk_size=options['chunk_size'],
+            max_lines=options['max_lines'],
+            rebuild=options['rebuild'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Counted co-purchases for {processed} new orders')
+        )
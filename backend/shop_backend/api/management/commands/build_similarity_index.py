@@ -0,0 +1,34 @@
+"""
+Management команда для индекса похожих товаров (по названию и описанию)
+
+По умолчанию пересчитывает только товары, изменённые после прошлой
+сборки (и строит индекс с нуля, если его ещё нет).
+--rebuild — полная сборка с пересчётом IDF.
+
+Запуск: python manage.py build_similarity_index [--rebuild]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from api.similarity import build_index, update_index
+
+
+class Command(BaseCommand):
+    help = 'Build or incrementally update the text similarity index for products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild the whole index')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['rebuild']:
+            count = build_index()
+            message = f'Indexed {count} products'
+        else:
+            count = update_index()
+            message = f'Updated {count} products in the index'
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 {message} in {time.perf_counter() - started:.1f}s')
+        )
@@ -0,0 +1,54 @@
+"""
+Management команда для удаления брошенных корзин
+
+Удаляет корзины, которые не менялись --days дней, пачками по
+--batch-size строк с паузой --pause секунд между пачками, чтобы не
+держать долгие блокировки (SQLite). С --stats перед удалением выводит
+статистику брошенных корзин.
+
+Запуск: python manage.py cleanup_abandoned_carts [--days 30] [--batch-size 500] [--pause 0.2] [--stats]
+(например, из cron раз в сутки)
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.abandoned_carts import abandoned_cart_stats, delete_abandoned_batch
+
+
+class Command(BaseCommand):
+    help = 'Delete carts that have not changed for N days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Delete carts untouched this long')
+        parser.add_argument('--batch-size', type=int, default=500, help='Cart lines per DELETE')
+        parser.add_argument('--pause', type=float, default=0.2, help='Seconds to sleep between batches')
+        parser.add_argument('--stats', action='store_true', help='Print abandoned cart stats first')
+        parser.add_argument('--dry-run', action='store_true', help='Only print stats, delete nothing')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        if options['stats'] or options['dry_run']:
+            stats = abandoned_cart_stats(cutoff)
+            oldest = stats['oldest'].isoformat() if stats['oldest'] else '-'
+            self.stdout.write(
+                f"Abandoned carts: {stats['carts']}, lines: {stats['lines']}, "
+                f"units: {stats['units']}, value: ${stats['value']:.2f}, oldest change: {oldest}"
+            )
+            if options['dry_run']:
+                return
+
+        deleted = 0
+        while True:
+            count = delete_abandoned_batch(cutoff, batch_size=options['batch_size'])
+            deleted += count
+            if count < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Deleted {deleted} abandoned cart lines')
+        )
@@ -0,0 +1,79 @@
+"""
+Management команда для массового создания пользователей
+(нагрузочные тесты, сидинг стендов)
+
+Пароли хешируются в пуле процессов, пользователи вставляются через bulk_create.
+
+Запуск: python manage.py create_users 10000 --prefix loadtest --password secret123
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+
+def _init_worker(settings_module):
+    # При spawn дочерний процесс стартует «с нуля» — настраиваем Django заново
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def _hash_password(raw_password):
+    return make_password(raw_password)
+
+
+class Command(BaseCommand):
+    help = 'Bulk create users with passwords hashed in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Number of users to create')
+        parser.add_argument('--prefix', default='user', help='Username prefix')
+        parser.add_argument('--password', default='password123', help='Password for all users')
+        parser.add_argument('--email-domain', default='example.com', help='Email domain')
+        parser.add_argument('--start', type=int, default=1, help='First username index')
+        parser.add_argument('--workers', type=int, default=None, help='Hashing processes (default: CPU count)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='bulk_create batch size')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        prefix = options['prefix']
+        start = options['start']
+        batch_size = options['batch_size']
+
+        usernames = [f'{prefix}{i}' for i in range(start, start + count)]
+
+        # Каждому пользователю — своя соль, поэтому хешируем для каждого отдельно
+        settings_module = os.environ.get('DJANGO_SETTINGS_MODULE', 'shop_backend.settings')
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=_init_worker,
+            initargs=(settings_module,),
+        ) as pool:
+            hashes = list(pool.map(
+                _hash_password,
+                [options['password']] * count,
+                chunksize=max(1, batch_size // 10),
+            ))
+
+        users = [
+            User(
+                username=username,
+                email=f"{username}@{options['email_domain']}",
+                password=password_hash,
+            )
+            for username, password_hash in zip(usernames, hashes)
+        ]
+
+        # Уже существующие логины пропускаются
+        User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Processed {count} users with prefix "{prefix}"')
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Total users in DB: {User.objects.count()}')
+        )
@@ -0,0 +1,35 @@
+"""
+Management команда для прореживания старой истории цен
+
+В истории старше --days остаётся одна цена на товар и интервал
+(--bucket-hours, по умолчанию сутки) — последняя цена интервала;
+записи, не меняющие цену, удаляются. Свежая история не трогается.
+
+Запуск: python manage.py downsample_price_history [--days 90] [--bucket-hours 24]
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.price_history import downsample
+
+
+class Command(BaseCommand):
+    help = 'Keep one price per product and interval in old price history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Downsample history older than this')
+        parser.add_argument('--bucket-hours', type=int, default=24, help='Interval that keeps one price')
+        parser.add_argument('--batch-size', type=int, default=200, help='Products per transaction')
+
+    def handle(self, *args, **options):
+        deleted = downsample(
+            timezone.now() - timedelta(days=options['days']),
+            bucket=timedelta(hours=options['bucket_hours']),
+            batch_size=options['batch_size'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Removed {deleted} price history records')
+        )
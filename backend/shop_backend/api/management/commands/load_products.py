@@ -13,12 +13,15 @@ api/
 """
 
 from django.core.management.base import BaseCommand
-from api.models import Category, Product
+from api.models import Category, Product, ProductVariant
 
 
 class Command(BaseCommand):
     help = 'Load products into database'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=100, help='Initial stock for each product')
+
     def handle(self, *args, **kwargs):
         # Создаем категории
         women_cat, _ = Category.objects.get_or_create(
@@ -375,7 +378,7 @@ class Command(BaseCommand):
         for product_data in products_data:
             product, created = Product.objects.get_or_create(
                 id=product_data['id'],
-                defaults=product_data
+                defaults={**product_data, 'stock': kwargs['stock']}
             )
             if created:
                 created_count += 1
@@ -383,6 +386,18 @@ class Command(BaseCommand):
                     self.style.SUCCESS(f'✅ Created: {product.name} (ID: {product.id})')
                 )
 
+        # Размеры для каждого товара (как в ProductDisplay на фронте)
+        ProductVariant.objects.bulk_create([
+            ProductVariant(
+                product_id=product_data['id'],
+                sku=f"P{product_data['id']}-{size}",
+                size=size,
+                stock=kwargs['stock']
+            )
+            for product_data in products_data
+            for size, _ in ProductVariant.SIZE_CHOICES
+        ], ignore_conflicts=True)
+
         self.stdout.write(
             self.style.SUCCESS(f'\n🎉 Successfully loaded {created_count} products!')
         )
@@ -0,0 +1,81 @@
+"""
+Management команда для сверки Order.total с позициями заказов
+
+Order.total поддерживается разницами при изменении позиций (signals.py);
+команда проверяет это целиком. Заказы идут пачками по id: на пачку —
+один агрегат SUM(price * quantity) с GROUP BY order_id (минус скидка
+заказа) и один bulk_update расходящихся сумм. Пачка блокирует свои заказы, поэтому
+параллельная правка позиций не потеряется.
+
+Запуск: python manage.py reconcile_order_totals [--batch-size 1000] [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from api.models import LINE_TOTAL, Order, OrderItem
+
+
+def reconcile_batch(after_id, batch_size, dry_run=False):
+    """
+    Сверяет до batch_size заказов с id > after_id. Возвращает
+    (проверенные id, [(id заказа, было, стало)]).
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.filter(id__gt=after_id)
+            .order_by('id')
+            .select_for_update()
+            .values_list('id', 'total', 'discount')[:batch_size]
+        )
+        if not orders:
+            return [], []
+
+        sums = dict(
+            OrderItem.objects.filter(order_id__gte=orders[0][0], order_id__lte=orders[-1][0])
+            .values('order_id')
+            .annotate(total=Sum(LINE_TOTAL))
+            .values_list('order_id', 'total')
+        )
+        expected = {
+            order_id: (sums.get(order_id) or 0) - discount for order_id, _, discount in orders
+        }
+        mismatched = [
+            (order_id, total, expected[order_id])
+            for order_id, total, _ in orders
+            if total != expected[order_id]
+        ]
+        if mismatched and not dry_run:
+            Order.objects.bulk_update(
+                [Order(id=order_id, total=expected) for order_id, _, expected in mismatched],
+                ['total'],
+            )
+    return [order_id for order_id, _, _ in orders], mismatched
+
+
+class Command(BaseCommand):
+    help = 'Verify and fix Order.total against order items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report mismatched totals')
+
+    def handle(self, *args, **options):
+        last_id, checked, fixed = 0, 0, 0
+
+        while True:
+            order_ids, mismatched = reconcile_batch(
+                last_id, options['batch_size'], dry_run=options['dry_run']
+            )
+            for order_id, total, expected in mismatched:
+                self.stdout.write(f'Order #{order_id}: {total} -> {expected}')
+            checked += len(order_ids)
+            fixed += len(mismatched)
+            if len(order_ids) < options['batch_size']:
+                break
+            last_id = order_ids[-1]
+
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 {action} {fixed} wrong totals in {checked} orders')
+        )
@@ -0,0 +1,57 @@
+"""
+Management команда для доставки событий outbox обработчикам
+
+Читает недоставленные события пачками по порядку id, вызывает
+обработчики из OUTBOX_HANDLERS и отмечает события доставленными.
+Запускается одним процессом (порядок событий). Доставленные события
+старше --keep-days удаляются.
+
+Запуск: python manage.py relay_outbox [--batch-size 100] [--interval 1] [--once]
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.outbox import outbox_stats, prune_delivered, relay_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events to handlers in order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events per transaction')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox and exit')
+        parser.add_argument('--keep-days', type=int, default=7, help='Keep delivered events this long')
+
+    def handle(self, *args, **options):
+        delivered = 0
+
+        while True:
+            try:
+                events = relay_batch(batch_size=options['batch_size'])
+            except Exception as exc:
+                # Пачка откатилась и будет доставлена повторно
+                self.stderr.write(self.style.ERROR(f'Outbox handler failed: {exc}'))
+                if options['once']:
+                    raise
+                time.sleep(options['interval'])
+                continue
+
+            delivered += len(events)
+            if events:
+                lag = (timezone.now() - events[-1].created_at).total_seconds()
+                self.stdout.write(f'Delivered {len(events)} events up to #{events[-1].id}, lag {lag:.1f}s')
+            if len(events) < options['batch_size']:
+                prune_delivered(timezone.now() - timedelta(days=options['keep_days']))
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+        stats = outbox_stats()
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Delivered {delivered} events, {stats["pending"]} pending')
+        )
@@ -0,0 +1,34 @@
+"""
+Management команда для снятия просроченных броней остатков
+
+Бронь снимается пачками: каждая пачка — отдельная короткая транзакция,
+остатки возвращаются одним UPDATE на пачку.
+
+Запуск: python manage.py release_expired_reservations [--batch-size 500]
+(например, из cron раз в минуту)
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock reservations back to product stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations per transaction')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        released = 0
+
+        while True:
+            count = release_expired(batch_size=options['batch_size'], now=now)
+            released += count
+            if count < options['batch_size']:
+                break
+
+        self.stdout.write(
+            self.style.SUCCESS(f'🎉 Released {released} expired reservations')
+        )
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .compression import compress, is_compressible, preferred_encoding
+
+
+# === Заголовки лимитов запросов ===
+class RateLimitHeadersMiddleware:
+    """
+    Добавляет X-RateLimit-* к ответам эндпоинтов с throttling.
+
+    Значения кладёт на запрос SlidingWindowRateThrottle (api/throttling.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            response['X-RateLimit-Limit'] = rate_limit['limit']
+            response['X-RateLimit-Remaining'] = rate_limit['remaining']
+            response['X-RateLimit-Reset'] = rate_limit['reset']
+
+        return response
+
+
+# === Сжатие ответов ===
+class CompressionMiddleware:
+    """
+    Сжимает brotli/gzip ответы API больше COMPRESSION_MIN_SIZE (api/compression.py).
+    Ответы, у которых уже есть Content-Encoding (кеш сжатых ответов
+    каталога), и потоковые выгрузки не трогает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not is_compressible(request, response)
+            or len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = preferred_encoding(request)
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # Тело изменилось — сильный ETag становится слабым (как в GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Как у load_products --stock по умолчанию
+INITIAL_STOCK = 100
+
+
+def fill_stock(apps, schema_editor):
+    # Товары, созданные до учёта остатков, продавались без ограничений —
+    # без этого после миграции они все стали бы «нет в наличии»
+    Product = apps.get_model('api', 'Product')
+    Product.objects.update(stock=INITIAL_STOCK)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_order_user_history_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_stock, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='unique_user_product_reservation')],
+            },
+        ),
+    ]
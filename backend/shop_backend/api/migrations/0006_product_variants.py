@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_stock_reservations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(max_length=64, unique=True)),
+                ('size', models.CharField(choices=[('S', 'S'), ('M', 'M'), ('L', 'L'), ('XL', 'XL'), ('XXL', 'XXL')], max_length=8)),
+                ('color', models.CharField(blank=True, max_length=32)),
+                ('stock', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='stockreservation',
+            name='unique_user_product_reservation',
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='api.product'),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.productvariant'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.productvariant'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.productvariant'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.UniqueConstraint(condition=models.Q(('variant__isnull', True)), fields=('user', 'product'), name='unique_user_product_reservation'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.UniqueConstraint(condition=models.Q(('variant__isnull', False)), fields=('user', 'variant'), name='unique_user_variant_reservation'),
+        ),
+        migrations.AddConstraint(
+            model_name='productvariant',
+            constraint=models.UniqueConstraint(fields=('product', 'size', 'color'), name='unique_product_variant'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CooccurrenceRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveIntegerField(default=0)),
+                ('orders_processed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cooccurrences', to='api.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-orders', 'related'], name='cooccurrence_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'related'), name='unique_product_cooccurrence')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_prices(apps, schema_editor):
+    # До этой миграции сумма позиции считалась по текущей цене товара
+    Product = apps.get_model('api', 'Product')
+    for model_name in ('OrderItem', 'ArchivedOrderItem'):
+        model = apps.get_model('api', model_name)
+        model.objects.update(
+            price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('new_price')[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0'), max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+
+def fill_paths(apps, schema_editor):
+    # Существующие категории — корни: path = "<id>/"
+    Category = apps.get_model('api', 'Category')
+    Category.objects.update(path=Concat(Cast('id', CharField()), Value('/')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_orderitem_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='api.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
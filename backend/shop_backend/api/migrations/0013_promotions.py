@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_category_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='coupon',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='coupon',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('percent', 'Percentage off'), ('fixed', 'Fixed amount off'), ('bundle', 'Bundle price')], max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('bundle_quantity', models.PositiveIntegerField(default=2)),
+                ('code', models.CharField(blank=True, max_length=32, null=True, unique=True)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('categories', models.ManyToManyField(blank=True, related_name='promotions', to='api.category')),
+                ('products', models.ManyToManyField(blank=True, related_name='promotions', to='api.product')),
+            ],
+        ),
+    ]
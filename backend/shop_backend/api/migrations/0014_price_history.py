@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_current_prices(apps, schema_editor):
+    # Начальная точка истории: текущая цена с момента последнего изменения товара
+    Product = apps.get_model('api', 'Product')
+    PriceHistory = apps.get_model('api', 'PriceHistory')
+    rows = Product.objects.values_list('id', 'updated_at', 'new_price').iterator(chunk_size=2000)
+    PriceHistory.objects.bulk_create(
+        (PriceHistory(product_id=product_id, at=at, price_cents=int(price * 100))
+         for product_id, at, price in rows),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_promotions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('at', models.DateTimeField()),
+                ('price_cents', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'at'], name='price_history_at_idx')],
+            },
+        ),
+        migrations.RunPython(record_current_prices, migrations.RunPython.noop),
+    ]
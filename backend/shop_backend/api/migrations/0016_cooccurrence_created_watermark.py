@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_watermark(apps, schema_editor):
+    # Прежняя отметка — id последнего учтённого заказа; в новой нужен и его
+    # created_at (заказ мог уйти в архив — тогда берём из архива)
+    CooccurrenceRun = apps.get_model('api', 'CooccurrenceRun')
+    for run in CooccurrenceRun.objects.filter(last_order_id__gt=0):
+        for model_name in ('Order', 'ArchivedOrder'):
+            orders = apps.get_model('api', model_name).objects.filter(id__lte=run.last_order_id)
+            run.last_created_at = orders.aggregate(last=Max('created_at'))['last']
+            if run.last_created_at:
+                run.save(update_fields=['last_created_at'])
+                break
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_cart_item_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cooccurrencerun',
+            name='last_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_watermark, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ),
+    ]
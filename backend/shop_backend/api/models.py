@@ -1,17 +1,92 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
 
 
+# Сумма позиции заказа в SQL: агрегаты Order.total (calculate_total, reconcile_order_totals)
+LINE_TOTAL = models.ExpressionWrapper(
+    F("price") * F("quantity"), output_field=models.DecimalField(max_digits=10, decimal_places=2)
+)
+
+
+# === Дерево категорий ===
+# path — id предков и самой категории через PATH_SEP: "1/", "1/7/", "1/7/12/".
+# Поддерево — диапазон path >= "1/7/" AND path < "1/70" (символ после
+# PATH_SEP): обычный индекс по path, без LIKE и рекурсивных запросов.
+# На PostgreSQL диапазон зависит от collation базы, там — LIKE "1/7/%"
+# по индексу *_like (varchar_pattern_ops), который db_index создаёт у CharField.
+PATH_SEP = "/"
+
+
+class PathSubtree(models.Lookup):
+    """path__subtree="1/7/": категория с этим path и все её потомки."""
+
+    lookup_name = "subtree"
+
+    def as_sql(self, compiler, connection):
+        # Не startswith: на SQLite LIKE ... ESCAPE отключает поиск по индексу
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        upper = self.rhs[:-1] + chr(ord(self.rhs[-1]) + 1)
+        return f"{lhs} >= %s AND {lhs} < %s", (*lhs_params, self.rhs, *lhs_params, upper)
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        return f"{lhs} LIKE %s", (*lhs_params, connection.ops.prep_for_like_query(self.rhs) + "%")
+
+
+def subtree_q(path, prefix=""):
+    """Q для категорий поддерева path; prefix — "category__" для товаров."""
+    return models.Q(**{f"{prefix}path__subtree": path})
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="children")
+    path = models.CharField(max_length=255, default="", editable=False, db_index=True)
 
     class Meta:
         verbose_name_plural = "Categories"
 
-    def str(self):
+    def __str__(self):
         return self.name
 
+    @property
+    def depth(self):
+        return self.path.count(PATH_SEP) - 1
+
+    def clean(self):
+        if self.pk and self.parent_id and Category.objects.filter(subtree_q(self.path), pk=self.parent_id).exists():
+            raise ValidationError({"parent": "Category cannot be moved into its own subtree"})
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old_path = None
+            if not self._state.adding:
+                old_path = Category.objects.filter(pk=self.pk).values_list("path", flat=True).first()
+            parent_path = ""
+            if self.parent_id:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list("path", flat=True).get()
+                if old_path and parent_path.startswith(old_path):
+                    raise ValidationError({"parent": "Category cannot be moved into its own subtree"})
+
+            super().save(*args, **kwargs)
+            path = f"{parent_path}{self.pk}{PATH_SEP}"
+            if path == old_path:
+                return
+            if old_path:
+                # Перенос поддерева: один UPDATE меняет префикс у всех потомков
+                Category.objects.filter(subtree_q(old_path)).update(
+                    path=Concat(Value(path), Substr("path", len(old_path) + 1))
+                )
+            else:
+                Category.objects.filter(pk=self.pk).update(path=path)
+            self.path = path
+
+Category._meta.get_field("path").register_lookup(PathSubtree)
+
 # ";vmksmvmsfvfm"
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="products")
@@ -20,20 +95,146 @@ class Product(models.Model):
     old_price = models.DecimalField(max_digits=10, decimal_places=2)
     new_price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.URLField(blank=True)
+    # Уменьшенные варианты изображения: [{'url', 'width', 'format'}, ...]
+    image_variants = models.JSONField(default=list, blank=True)
+    # Доступный остаток: зарезервированные в корзинах единицы уже вычтены
+    stock = models.PositiveIntegerField(default=0)
+    # Для инкрементальных выгрузок каталога (?since=)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
-    def str(self):
+    def __str__(self):
         return self.name
 
 
+class PriceHistory(models.Model):
+    """
+    Журнал цен товара (только добавление): с момента at товар стоил
+    price_cents / 100. Цена в целых центах — компактнее и без округлений
+    Decimal. Запись — price_history.record_prices, прореживание старой
+    истории — команда downsample_price_history.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="price_history")
+    at = models.DateTimeField()
+    price_cents = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # Цена на момент T: последняя запись с at <= T — один шаг по индексу
+            models.Index(fields=["product", "at"], name="price_history_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.at}: {self.price_cents}"
+
+
+class ProductVariant(models.Model):
+    """SKU товара: размер/цвет со своим остатком."""
+    SIZE_CHOICES = [
+        ("S", "S"),
+        ("M", "M"),
+        ("L", "L"),
+        ("XL", "XL"),
+        ("XXL", "XXL"),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="variants")
+    sku = models.CharField(max_length=64, unique=True)
+    size = models.CharField(max_length=8, choices=SIZE_CHOICES)
+    color = models.CharField(max_length=32, blank=True)
+    # Как и Product.stock: забронированные единицы уже вычтены
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "size", "color"], name="unique_product_variant"),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} ({self.sku})"
+
+
 class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="cart_items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
+    # Брошенные корзины удаляет команда cleanup_abandoned_carts
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Последнее изменение корзины пользователя (MAX по updated_at)
+            models.Index(fields=["user", "updated_at"], name="cart_item_user_updated_idx"),
+        ]
 
     def subtotal(self):
         return self.product.new_price * self.quantity
 
-    def str(self):
+    def __str__(self):
+        return f"{self.user.username} - {self.product.name} ({self.quantity})"
+
+
+class Promotion(models.Model):
+    """
+    Правило цены корзины (см. promotions.py).
+
+    percent — value% с каждой подходящей позиции; fixed — value с суммы
+    подходящих позиций заказа; bundle — каждые bundle_quantity единиц одного
+    товара стоят value. Подходящие позиции — товары из products и категории
+    из categories вместе с подкатегориями; если оба пусты — вся корзина.
+    С code правило работает только по купону.
+    """
+    KIND_CHOICES = [
+        ("percent", "Percentage off"),
+        ("fixed", "Fixed amount off"),
+        ("bundle", "Bundle price"),
+    ]
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    bundle_quantity = models.PositiveIntegerField(default=2)
+    products = models.ManyToManyField(Product, blank=True, related_name="promotions")
+    categories = models.ManyToManyField(Category, blank=True, related_name="promotions")
+    code = models.CharField(max_length=32, unique=True, null=True, blank=True)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.code})" if self.code else self.name
+
+
+class StockReservation(models.Model):
+    """
+    Временная бронь остатка под товар в корзине.
+
+    Пока запись существует, её quantity вычтено из ProductVariant.stock
+    (или Product.stock для товаров без вариантов).
+    После expires_at бронь снимает команда release_expired_reservations.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="stock_reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True)
+    quantity = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product"],
+                condition=models.Q(variant__isnull=True),
+                name="unique_user_product_reservation",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "variant"],
+                condition=models.Q(variant__isnull=False),
+                name="unique_user_variant_reservation",
+            ),
+        ]
+
+    def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.quantity})"
 
 
@@ -42,27 +243,149 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, default="Pending")
+    # Скидка акций на момент оформления (promotions.py): total = сумма позиций - discount
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    coupon = models.CharField(max_length=32, blank=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # История заказов пользователя (OrderHistoryPagination)
+            models.Index(fields=["user", "-created_at", "-id"], name="order_user_history_idx"),
+            # Новые заказы по порядку (build_related_products)
+            models.Index(fields=["created_at", "id"], name="order_created_idx"),
+        ]
 
-    def str(self):
+    def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
 
     def calculate_total(self):
-        total = sum(item.subtotal() for item in self.order_items.all())
+        # Полный пересчёт одним агрегатом; дальше total поддерживают сигналы OrderItem
+        total = (self.order_items.aggregate(total=Sum(LINE_TOTAL))['total'] or 0) - self.discount
         self.total = total
-        self.save()
+        self.save(update_fields=["total"])
         return total
 
 
 class OrderItem(models.Model):
+    """
+    Позиция заказа. price — цена единицы на момент добавления (по умолчанию
+    текущая new_price товара): изменение цены товара не меняет старые заказы.
+    Order.total меняется на разницу при каждом сохранении/удалении позиции
+    (signals.py), команда reconcile_order_totals сверяет суммы целиком.
+    """
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="order_items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2, blank=True)
 
     def subtotal(self):
-        return self.product.new_price * self.quantity
+        return self.price * self.quantity
+
+    def __str__(self):
+        return f"{self.order} - {self.product.name} ({self.quantity})"
+
+class ProductCooccurrence(models.Model):
+    """
+    В скольких заказах товары куплены вместе («с этим товаром покупают»).
+
+    Пара хранится в обе стороны, поэтому top-K соседей товара — это
+    префикс индекса (product, -orders). Счётчики наращивает команда
+    build_related_products по заказам, появившимся с прошлого запуска.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="cooccurrences")
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "related"], name="unique_product_cooccurrence"),
+        ]
+        indexes = [
+            models.Index(fields=["product", "-orders", "related"], name="cooccurrence_top_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.related_id} ({self.orders})"
+
+
+class CooccurrenceRun(models.Model):
+    """
+    Запуск build_related_products: заказы до (last_created_at, last_order_id)
+    включительно уже учтены (см. api/recommendations.py).
+    """
+    last_created_at = models.DateTimeField(null=True, blank=True)
+    last_order_id = models.PositiveIntegerField(default=0)
+    orders_processed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Run #{self.id} up to order {self.last_order_id}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Событие об изменении каталога или заказов для внешних систем
+    (кеши, поисковый индекс, CDN). Пишется в той же транзакции, что и
+    само изменение; команда relay_outbox доставляет события по порядку id
+    и отмечает delivered_at. Массовые изменения — одна строка на пачку id.
+    """
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Очередь недоставленных событий
+            models.Index(
+                fields=["id"],
+                condition=models.Q(delivered_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.topic}"
+
+
+# === Архив заказов ===
+class ArchivedOrder(models.Model):
+    """
+    Завершённый (Delivered/Cancelled) старый заказ, перенесённый командой
+    archive_orders из Order с тем же id. Живая таблица остаётся маленькой,
+    история пользователя читает обе (?include_archived=true).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_orders")
+    created_at = models.DateTimeField()
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    coupon = models.CharField(max_length=32, blank=True)
+    status = models.CharField(max_length=20)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-id"], name="archived_order_history_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.id} - {self.user.username}"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name="order_items")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def subtotal(self):
+        return self.price * self.quantity
 
-    def str(self):
-        return f"{self.order} - {self.product.name} ({self.quantity})"
\ No newline at end of file
+    def __str__(self):
+        return f"{self.order} - {self.product.name} ({self.quantity})"
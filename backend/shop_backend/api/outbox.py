@@ -0,0 +1,110 @@
+"""
+Transactional outbox: события об изменениях каталога и заказов.
+
+emit()/emit_many() вызываются внутри транзакции, которая меняет данные,
+поэтому событие появляется тогда и только тогда, когда изменение
+закоммичено. Массовые изменения пишут одну строку на BATCH_IDS id.
+
+relay_batch() (команда relay_outbox) читает недоставленные события по
+порядку id, передаёт их обработчикам из OUTBOX_HANDLERS и отмечает
+delivered_at одним UPDATE — в той же транзакции, что и эффекты
+обработчиков в БД. Если обработчик упал, пачка откатывается и будет
+доставлена заново: обработчики должны быть идемпотентны (сброс кеша,
+переиндексация). Релей должен быть один — так сохраняется порядок.
+
+Топики: product.changed, product.deleted, category.changed,
+category.deleted, order.created, order.status_changed.
+"""
+
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxEvent
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_IDS = 500
+
+
+def emit(topic, payload):
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def emit_many(topic, ids, **payload):
+    """Событие о многих объектах: {'ids': [...до BATCH_IDS], **payload} на строку."""
+    ids = list(ids)
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=topic, payload={'ids': ids[start:start + BATCH_IDS], **payload})
+        for start in range(0, len(ids), BATCH_IDS)
+    ])
+
+
+@lru_cache(maxsize=None)
+def _handlers(topic):
+    paths = settings.OUTBOX_HANDLERS.get(topic, []) + settings.OUTBOX_HANDLERS.get('*', [])
+    return [import_string(path) for path in paths]
+
+
+def log_event(event):
+    logger.info('outbox #%s %s %s', event.id, event.topic, event.payload)
+
+
+def relay_batch(batch_size=100):
+    """Доставляет одну пачку событий. Возвращает доставленные события."""
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update()
+            .filter(delivered_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        for event in events:
+            for handler in _handlers(event.topic):
+                handler(event)
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+            delivered_at=timezone.now()
+        )
+    return events
+
+
+def outbox_stats(now=None):
+    """Метрики отставания релея."""
+    now = now or timezone.now()
+    pending = OutboxEvent.objects.filter(delivered_at__isnull=True).aggregate(
+        count=Count('id'), oldest=Min('created_at')
+    )
+    last = (
+        OutboxEvent.objects.filter(delivered_at__isnull=False)
+        .order_by('-id')
+        .values('id', 'created_at', 'delivered_at')
+        .first()
+    )
+    return {
+        'pending': pending['count'],
+        # Возраст самого старого недоставленного события
+        'lag_seconds': (now - pending['oldest']).total_seconds() if pending['oldest'] else 0,
+        'last_delivered_id': last['id'] if last else None,
+        'last_delivery_delay_seconds': (
+            (last['delivered_at'] - last['created_at']).total_seconds() if last else None
+        ),
+    }
+
+
+def prune_delivered(before, batch_size=1000):
+    """Удаляет доставленные события старше before пачками. Возвращает число удалённых."""
+    deleted = 0
+    while True:
+        ids = list(
+            OutboxEvent.objects.filter(delivered_at__lt=before)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(id__in=ids).delete()[0]
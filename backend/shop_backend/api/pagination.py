@@ -0,0 +1,81 @@
+import binascii
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# === Пагинация истории заказов ===
+class OrderHistoryPagination(CursorPagination):
+    """
+    Keyset-пагинация по (-created_at, -id): страница читается по индексу
+    order_user_history_idx, без OFFSET по всей истории пользователя.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class CombinedHistoryPagination(BasePagination):
+    """
+    История сразу из живой и архивной таблиц (?include_archived=true).
+
+    Каждая таблица читается keyset-запросом по (-created_at, -id) через
+    свой индекс истории, две страницы по page_size + 1 сливаются в одну.
+    Курсор — created_at и id последнего заказа страницы; только вперёд.
+    """
+    page_size = OrderHistoryPagination.page_size
+    page_size_query_param = OrderHistoryPagination.page_size_query_param
+    max_page_size = OrderHistoryPagination.max_page_size
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, order_id = b64decode(encoded.encode()).decode().rsplit('|', 1)
+            position = parse_datetime(created_at), int(order_id)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound('Invalid cursor')
+        if position[0] is None:
+            raise NotFound('Invalid cursor')
+        return position
+
+    def encode_cursor(self, order):
+        encoded = b64encode(f'{order.created_at.isoformat()}|{order.id}'.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def paginate_querysets(self, querysets, request):
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        rows = []
+        for queryset in querysets:
+            if position:
+                created_at, order_id = position
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id)
+                )
+            rows.extend(queryset.order_by('-created_at', '-id')[:size + 1])
+
+        rows.sort(key=lambda order: (order.created_at, order.id), reverse=True)
+        page = rows[:size]
+        self.next_link = self.encode_cursor(page[-1]) if len(rows) > size else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.next_link, 'previous': None, 'results': data})
@@ -0,0 +1,13 @@
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+# === Доступ для сотрудников и партнёров ===
+class IsStaffOrPartner(BasePermission):
+    """Сотрудники (is_staff) или участники группы PARTNER_GROUP."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        return user.is_staff or user.groups.filter(name=settings.PARTNER_GROUP).exists()
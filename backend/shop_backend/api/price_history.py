@@ -0,0 +1,127 @@
+"""
+История цен товаров: запись, график и прореживание.
+
+Каждое изменение new_price добавляет строку PriceHistory (товар, момент,
+цена в центах): одиночные сохранения — сигналом (signals.py), массовые
+скидки в админке — одним bulk_create на всё действие.
+
+Цена на момент T — последняя запись с at <= T (индекс product, at).
+Старую историю прореживает команда downsample_price_history: в каждом
+интервале остаётся последняя цена, записи без изменения цены удаляются.
+"""
+
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PriceHistory, Product
+
+
+CHART_DAYS = 365
+MAX_CHART_POINTS = 2000
+DELETE_CHUNK = 1000
+
+
+def to_cents(price):
+    return int((Decimal(price) * 100).quantize(Decimal('1'), ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def record_prices(prices, at=None):
+    """prices — [(product_id, цена)]. Все записи — одним bulk_create."""
+    at = at or timezone.now()
+    return PriceHistory.objects.bulk_create(
+        [PriceHistory(product_id=product_id, at=at, price_cents=to_cents(price)) for product_id, price in prices],
+        batch_size=1000,
+    )
+
+
+def price_at(product_id, at):
+    cents = (
+        PriceHistory.objects.filter(product_id=product_id, at__lte=at)
+        .order_by('-at', '-id')
+        .values_list('price_cents', flat=True)
+        .first()
+    )
+    return from_cents(cents) if cents is not None else None
+
+
+def price_chart(product_id, since, until):
+    """
+    Точки ступенчатого графика цены на [since, until]: первая — цена на
+    момент since (если товар уже продавался), дальше — каждое изменение.
+    Цена — строкой "80.00", как DecimalField в остальном API (Decimal в
+    Response отрисовался бы числом с плавающей точкой).
+    """
+    points = []
+    start = price_at(product_id, since)
+    if start is not None:
+        points.append({'at': since, 'price': str(start)})
+    rows = (
+        PriceHistory.objects.filter(product_id=product_id, at__gt=since, at__lte=until)
+        .order_by('at', 'id')
+        .values_list('at', 'price_cents')[:MAX_CHART_POINTS]
+    )
+    points.extend({'at': at, 'price': str(from_cents(cents))} for at, cents in rows)
+    return points
+
+
+def _redundant_ids(rows, bucket):
+    """
+    rows — (id, at, price_cents) одного товара по возрастанию at.
+    Возвращает id записей, которые не нужны после прореживания.
+    """
+    keep, drop = [], []
+    for row in rows:
+        # Одна запись на интервал: более поздняя в интервале вытесняет раннюю
+        if keep and _bucket_of(row[1], bucket) == _bucket_of(keep[-1][1], bucket):
+            drop.append(keep.pop()[0])
+        keep.append(row)
+
+    previous = None
+    for row in keep:
+        if row[2] == previous:
+            drop.append(row[0])
+        previous = row[2]
+    return drop
+
+
+def _bucket_of(moment, bucket):
+    return int(moment.timestamp() // bucket.total_seconds())
+
+
+def downsample(before, bucket=timedelta(days=1), batch_size=200):
+    """
+    Прореживает историю до before. Товары — пачками по id, каждая пачка —
+    отдельная транзакция. Возвращает число удалённых записей.
+    """
+    deleted, last_id = 0, 0
+    while True:
+        product_ids = list(
+            Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not product_ids:
+            return deleted
+        last_id = product_ids[-1]
+
+        rows = (
+            PriceHistory.objects.filter(product_id__in=product_ids, at__lt=before)
+            .order_by('product_id', 'at', 'id')
+            .values_list('product_id', 'id', 'at', 'price_cents')
+        )
+        drop, current, product_rows = [], None, []
+        for product_id, *row in rows:
+            if product_id != current:
+                drop.extend(_redundant_ids(product_rows, bucket))
+                current, product_rows = product_id, []
+            product_rows.append(row)
+        drop.extend(_redundant_ids(product_rows, bucket))
+
+        with transaction.atomic():
+            for start in range(0, len(drop), DELETE_CHUNK):
+                deleted += PriceHistory.objects.filter(id__in=drop[start:start + DELETE_CHUNK]).delete()[0]
@@ -0,0 +1,267 @@
+"""
+Акции и купоны: цена корзины с учётом Promotion.
+
+Активные акции компилируются в PricingPlan — словари «товар → правила»
+и «категория → правила» (категория сразу раскрыта на все подкатегории)
+плюс правила на всю корзину. Расчёт корзины — только обращения к
+словарям и арифметика Decimal, без запросов к БД: 100 позиций при
+сотнях правил укладываются в доли миллисекунды.
+
+План живёт в памяти процесса и пересобирается, когда меняется версия
+акций (её поднимают сигналы Promotion и Category, см. signals.py),
+наступает ближайшее начало/окончание какой-либо акции или план старше
+PLAN_MAX_AGE — на случай, если версию поднял другой процесс, а кеш у
+каждого процесса свой (LocMemCache).
+
+Скидки не складываются: на позицию действует одна самая выгодная
+позиционная скидка (percent или bundle), на заказ — одна самая выгодная
+fixed, от суммы позиций после их скидок. Купонные правила выбираются
+наравне с остальными, если купон указан.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Category, Promotion
+
+
+PROMOTION_VERSION_KEY = 'promotion_version'
+PLAN_MAX_AGE = 60
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def normalize_code(code):
+    return code.strip().upper() if code else None
+
+
+def promotion_version():
+    return cache.get(PROMOTION_VERSION_KEY, 0)
+
+
+def bump_promotion_version():
+    try:
+        cache.incr(PROMOTION_VERSION_KEY)
+    except ValueError:
+        cache.set(PROMOTION_VERSION_KEY, 1, None)
+
+
+def _bucket(rules):
+    """
+    Правила одного ключа (товар, категория или вся корзина) в виде для
+    быстрого расчёта. Из percent-правил без купона важно только наибольшее,
+    из bundle с одинаковым размером и купоном — самое дешёвое: лишние
+    отбрасываются здесь, а не в каждом расчёте.
+
+    (процент, его id, {купон: (процент, id)}, bundle-правила, fixed-правила)
+    """
+    percent, percent_id, coupon_percent, bundles, fixed = ZERO, None, {}, {}, []
+    for promotion_id, kind, value, size, code in rules:
+        if kind == 'percent' and not code:
+            if value > percent:
+                percent, percent_id = value, promotion_id
+        elif kind == 'percent':
+            if value > coupon_percent.get(code, (ZERO,))[0]:
+                coupon_percent[code] = (value, promotion_id)
+        elif kind == 'bundle':
+            if (size, code) not in bundles or value < bundles[size, code][0]:
+                bundles[size, code] = (value, promotion_id)
+        else:
+            fixed.append((promotion_id, value, code))
+    bundles = tuple((size, value, code, promotion_id) for (size, code), (value, promotion_id) in bundles.items())
+    return percent, percent_id, coupon_percent, bundles, tuple(fixed)
+
+
+class PricingPlan:
+    """
+    Скомпилированные активные акции на момент now. valid_until — когда
+    план устареет сам по себе (ближайшее начало или окончание акции).
+    """
+
+    def __init__(self, promotions, product_links, category_links, categories, now):
+        by_product, by_category, anywhere = defaultdict(list), defaultdict(list), []
+        self.coupons = set()
+        self.valid_until = None
+
+        # Подкатегории каждой категории по path (категорий немного)
+        paths = sorted((path, category_id) for category_id, path in categories)
+        subtree = {
+            category_id: [other_id for other_path, other_id in paths if other_path.startswith(path)]
+            for path, category_id in paths
+        }
+
+        for promotion in promotions:
+            if promotion.starts_at and promotion.starts_at > now:
+                self._expire_at(promotion.starts_at)
+                continue
+            if promotion.ends_at:
+                self._expire_at(promotion.ends_at)
+
+            code = normalize_code(promotion.code)
+            if code:
+                self.coupons.add(code)
+            rule = (promotion.id, promotion.kind, promotion.value, max(promotion.bundle_quantity, 1), code)
+
+            product_ids = product_links.get(promotion.id, ())
+            category_ids = {
+                descendant
+                for category_id in category_links.get(promotion.id, ())
+                for descendant in subtree.get(category_id, ())
+            }
+            if not product_ids and not category_ids:
+                anywhere.append(rule)
+            for product_id in product_ids:
+                by_product[product_id].append(rule)
+            for category_id in category_ids:
+                by_category[category_id].append(rule)
+
+        self.by_product = {key: _bucket(rules) for key, rules in by_product.items()}
+        self.by_category = {key: _bucket(rules) for key, rules in by_category.items()}
+        # fixed на всю корзину считаются один раз от итоговой суммы, не по позициям
+        self.anywhere_fixed = [(rule[0], rule[2], rule[4]) for rule in anywhere if rule[1] == 'fixed']
+        anywhere = [rule for rule in anywhere if rule[1] != 'fixed']
+        self.anywhere = _bucket(anywhere) if anywhere else None
+
+    def _expire_at(self, moment):
+        if self.valid_until is None or moment < self.valid_until:
+            self.valid_until = moment
+
+    def price(self, lines, coupon=None):
+        """
+        lines — [(product_id, category_id, unit_price, quantity)].
+        Возвращает суммы корзины и скидки по позициям (в порядке lines).
+        """
+        coupon = normalize_code(coupon)
+        if coupon not in self.coupons:
+            coupon = None
+
+        subtotal = discount = net_total = ZERO
+        line_results = []
+        # id fixed-правила -> [значение, сумма подходящих позиций после их скидок]
+        order_candidates = {}
+
+        for product_id, category_id, unit_price, quantity in lines:
+            amount = unit_price * quantity
+            best, best_id = ZERO, None
+            best_percent, best_percent_id = ZERO, None
+            fixed = []
+
+            for bucket in (self.by_product.get(product_id), self.by_category.get(category_id), self.anywhere):
+                if bucket is None:
+                    continue
+                percent, percent_id, coupon_percent, bundles, fixed_rules = bucket
+                if percent > best_percent:
+                    best_percent, best_percent_id = percent, percent_id
+                if coupon in coupon_percent and coupon_percent[coupon][0] > best_percent:
+                    best_percent, best_percent_id = coupon_percent[coupon]
+                # bundle: каждые size единиц товара стоят value
+                for size, value, code, promotion_id in bundles:
+                    if quantity < size or (code and code != coupon):
+                        continue
+                    saving = (quantity // size) * (size * unit_price - value)
+                    if saving > best:
+                        best, best_id = saving, promotion_id
+                fixed.extend(fixed_rules)
+
+            if best_percent:
+                percent_discount = (amount * best_percent / 100).quantize(CENT, ROUND_HALF_UP)
+                if percent_discount > best:
+                    best, best_id = percent_discount, best_percent_id
+
+            best = min(best, amount)
+            subtotal += amount
+            discount += best
+            line_results.append({'discount': best, 'promotion_id': best_id})
+
+            net = amount - best
+            net_total += net
+            counted = set()
+            for promotion_id, value, code in fixed:
+                # Правило может совпасть с позицией и по товару, и по категории
+                if (code and code != coupon) or promotion_id in counted:
+                    continue
+                counted.add(promotion_id)
+                candidate = order_candidates.setdefault(promotion_id, [value, ZERO])
+                candidate[1] += net
+
+        for promotion_id, value, code in self.anywhere_fixed:
+            if not code or code == coupon:
+                order_candidates[promotion_id] = [value, net_total]
+
+        order_discount, order_promotion_id = ZERO, None
+        for promotion_id, (value, matched_amount) in order_candidates.items():
+            amount = min(value, matched_amount)
+            if amount > order_discount:
+                order_discount, order_promotion_id = amount, promotion_id
+        discount += order_discount
+
+        return {
+            'subtotal': subtotal,
+            'discount': discount,
+            'total': subtotal - discount,
+            'lines': line_results,
+            'order_promotion_id': order_promotion_id,
+            'coupon': coupon,
+        }
+
+
+def compile_plan(now=None):
+    """Собирает план из БД — четыре запроса независимо от числа акций."""
+    now = now or timezone.now()
+    promotions = list(
+        Promotion.objects.filter(is_active=True)
+        .filter(Q(ends_at__isnull=True) | Q(ends_at__gt=now))
+        .order_by('id')
+    )
+    ids = [promotion.id for promotion in promotions]
+
+    product_links, category_links = defaultdict(list), defaultdict(list)
+    for promotion_id, product_id in Promotion.products.through.objects.filter(
+        promotion_id__in=ids
+    ).values_list('promotion_id', 'product_id'):
+        product_links[promotion_id].append(product_id)
+    for promotion_id, category_id in Promotion.categories.through.objects.filter(
+        promotion_id__in=ids
+    ).values_list('promotion_id', 'category_id'):
+        category_links[promotion_id].append(category_id)
+
+    return PricingPlan(
+        promotions, product_links, category_links,
+        Category.objects.values_list('id', 'path'), now,
+    )
+
+
+_state = {'plan': None, 'version': None, 'built': 0.0}
+_compile_lock = threading.Lock()
+
+
+def get_plan():
+    now = timezone.now()
+    version = promotion_version()
+    plan = _state['plan']
+    if (
+        plan is not None
+        and _state['version'] == version
+        and (plan.valid_until is None or now < plan.valid_until)
+        and time.monotonic() - _state['built'] <= PLAN_MAX_AGE
+    ):
+        return plan
+
+    with _compile_lock:
+        plan = compile_plan(now)
+        _state.update(plan=plan, version=version, built=time.monotonic())
+    return plan
+
+
+def price_cart(items, coupon=None):
+    """Цена корзины из CartItem (product должен быть загружен)."""
+    return get_plan().price(
+        [(item.product_id, item.product.category_id, item.product.new_price, item.quantity) for item in items],
+        coupon,
+    )
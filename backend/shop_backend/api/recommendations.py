@@ -0,0 +1,181 @@
+"""
+«С этим товаром покупают»: совместные покупки по OrderItem.
+
+build_cooccurrence() читает только заказы, появившиеся после прошлого
+запуска, пачками по chunk_size заказов в порядке (created_at, id). Пары
+товаров внутри пачки считаются в NumPy (без Python-цикла по строкам),
+затем счётчики ProductCooccurrence наращиваются одним upsert на пачку.
+Пачка и сдвиг отметки CooccurrenceRun (last_created_at, last_order_id)
+пишутся в одной транзакции, так что прерванный запуск продолжается с
+места остановки.
+
+Отметка — не максимальный id: id и created_at заказ получает при вставке,
+а виден он после коммита, и транзакция с меньшим id может закоммититься
+позже уже учтённых заказов. Поэтому заказы моложе SAFETY_LAG не читаются,
+пока оформление не закоммитится наверняка.
+
+related_product_ids() отдаёт top-K соседей товара — префикс индекса
+(product, -orders, related), т.е. O(K), плюс кеш.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CooccurrenceRun, Order, OrderItem, ProductCooccurrence
+
+
+RELATED_LIMIT = 8
+MAX_RELATED_LIMIT = 50
+RELATED_CACHE_TIMEOUT = 15 * 60
+
+# Строки заказа сверх лимита не учитываются: пар в заказе n², а огромные
+# оптовые заказы ничего не говорят о «покупают вместе»
+MAX_ORDER_LINES = 50
+
+# Заказы моложе этого ещё могут быть в незакоммиченной транзакции оформления
+SAFETY_LAG = timedelta(minutes=5)
+
+# Ограничение SQLite на число параметров в одном запросе
+_LOOKUP_BATCH = 500
+
+
+def count_pairs(order_ids, product_ids, max_lines=MAX_ORDER_LINES):
+    """
+    order_ids, product_ids — массивы строк заказов, отсортированные по заказу.
+    Возвращает (product, related, orders) — уникальные упорядоченные пары
+    разных товаров и число заказов, в которых они встретились.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(order_ids):
+        return empty, empty, empty
+
+    # Товар, купленный дважды в одном заказе (разные размеры), считаем один раз
+    lines = np.unique(np.stack([order_ids, product_ids], axis=1), axis=0)
+    orders, products = lines[:, 0], lines[:, 1]
+
+    _, starts, sizes = np.unique(orders, return_index=True, return_counts=True)
+    if sizes.max() > max_lines:
+        # Оставляем первые max_lines строк каждого заказа
+        position = np.arange(len(products)) - np.repeat(starts, sizes)
+        products = products[position < max_lines]
+        sizes = np.minimum(sizes, max_lines)
+        starts = np.cumsum(sizes) - sizes
+
+    # Каждая строка заказа в паре со всеми строками того же заказа
+    per_line = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(products)), per_line)
+    line_start = np.repeat(np.repeat(starts, sizes), per_line)
+    offset = np.arange(len(left)) - np.repeat(np.cumsum(per_line) - per_line, per_line)
+    right = line_start + offset
+
+    distinct = left != right
+    left, right = products[left[distinct]], products[right[distinct]]
+
+    base = int(products.max()) + 1
+    keys, counts = np.unique(left.astype(np.int64) * base + right, return_counts=True)
+    return keys // base, keys % base, counts
+
+
+def _merge_counts(product, related, counts):
+    """Прибавляет пары к ProductCooccurrence одним upsert."""
+    deltas = {
+        (int(p), int(r)): int(c) for p, r, c in zip(product, related, counts)
+    }
+    product_ids = sorted({p for p, _ in deltas})
+    for start in range(0, len(product_ids), _LOOKUP_BATCH):
+        existing = ProductCooccurrence.objects.filter(
+            product_id__in=product_ids[start:start + _LOOKUP_BATCH]
+        ).values_list('product_id', 'related_id', 'orders')
+        for product_id, related_id, orders in existing:
+            if (product_id, related_id) in deltas:
+                deltas[(product_id, related_id)] += orders
+
+    ProductCooccurrence.objects.bulk_create(
+        [
+            ProductCooccurrence(product_id=p, related_id=r, orders=orders)
+            for (p, r), orders in deltas.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['product', 'related'],
+        update_fields=['orders'],
+        batch_size=2000,
+    )
+
+
+def _keyset_q(mark, lookup, prefix=''):
+    """Q для (created_at, id) <lookup> mark, lookup — 'gt', 'gte', 'lt' или 'lte'."""
+    created_at, order_id = mark
+    return (
+        Q(**{f'{prefix}created_at__{lookup[:2]}': created_at})
+        | Q(**{f'{prefix}created_at': created_at, f'{prefix}id__{lookup}': order_id})
+    )
+
+
+def build_cooccurrence(chunk_size=5000, max_lines=MAX_ORDER_LINES, rebuild=False, lag=SAFETY_LAG):
+    """Учитывает новые заказы. Возвращает число обработанных заказов."""
+    if rebuild:
+        with transaction.atomic():
+            ProductCooccurrence.objects.all().delete()
+            CooccurrenceRun.objects.all().delete()
+
+    last = (
+        CooccurrenceRun.objects.exclude(last_created_at=None)
+        .order_by('-last_created_at', '-last_order_id').first()
+    )
+    run = CooccurrenceRun.objects.create(
+        last_created_at=last.last_created_at if last else None,
+        last_order_id=last.last_order_id if last else 0,
+    )
+
+    # Отменённые на момент подсчёта заказы не учитываем
+    orders = (
+        Order.objects.exclude(status='Cancelled')
+        .filter(created_at__lte=timezone.now() - lag)
+        .order_by('created_at', 'id')
+    )
+    while True:
+        pending = orders
+        if run.last_created_at is not None:
+            pending = pending.filter(_keyset_q((run.last_created_at, run.last_order_id), 'gt'))
+        chunk = list(pending.values_list('created_at', 'id')[:chunk_size])
+        if not chunk:
+            break
+
+        rows = np.array(
+            OrderItem.objects.filter(
+                _keyset_q(chunk[0], 'gte', 'order__'), _keyset_q(chunk[-1], 'lte', 'order__')
+            )
+            .exclude(order__status='Cancelled')
+            .order_by('order_id')
+            .values_list('order_id', 'product_id'),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+        with transaction.atomic():
+            product, related, counts = count_pairs(rows[:, 0], rows[:, 1], max_lines)
+            if len(counts):
+                _merge_counts(product, related, counts)
+            run.last_created_at, run.last_order_id = chunk[-1]
+            run.orders_processed += len(chunk)
+            run.save(update_fields=['last_created_at', 'last_order_id', 'orders_processed'])
+
+    return run.orders_processed
+
+
+def related_product_ids(product_id, limit=RELATED_LIMIT):
+    """Id товаров, чаще всего покупаемых вместе с product_id."""
+    key = f'related_products:{product_id}:{limit}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            ProductCooccurrence.objects.filter(product_id=product_id)
+            .order_by('-orders', 'related_id')
+            .values_list('related_id', flat=True)[:limit]
+        )
+        cache.set(key, ids, RELATED_CACHE_TIMEOUT)
+    return ids
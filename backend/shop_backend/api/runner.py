@@ -0,0 +1,14 @@
+"""
+Тест-раннер проекта: тесты с тегом benchmark (замеры времени) по умолчанию
+не запускаются — на общем CI время плавает и такие проверки флапают.
+Запуск замеров: python manage.py test api --tag benchmark
+"""
+
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    def __init__(self, tags=None, exclude_tags=None, **kwargs):
+        if 'benchmark' not in (tags or ()):
+            exclude_tags = {*(exclude_tags or ()), 'benchmark'}
+        super().__init__(tags=tags, exclude_tags=exclude_tags, **kwargs)
@@ -1,29 +1,67 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Category, Product, CartItem, Order, OrderItem
+from .models import Category, Product, ProductVariant, CartItem, Order, OrderItem
+from .images import build_srcset
+from .fieldsets import DynamicFieldsMixin
+from .inventory import OutOfStock, commit_cart, sync_reservation
+from .outbox import emit
+from .promotions import get_plan, normalize_code, price_cart
 from django.contrib.auth.models import User
 
 
 # === Сериализатор категории ===
 class CategorySerializer(serializers.ModelSerializer):
+    depth = serializers.IntegerField(read_only=True)
+    
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description']
+        fields = ['id', 'name', 'description', 'parent', 'path', 'depth']
+        read_only_fields = ['path']
+    
+    def validate_parent(self, parent):
+        if parent and self.instance and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError('Category cannot be moved into its own subtree')
+        return parent
+
+
+# === Сериализатор варианта товара (SKU) ===
+class ProductVariantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductVariant
+        fields = ['id', 'sku', 'size', 'color', 'stock']
 
 
 # === Сериализатор товара (для чтения) ===
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_srcset = serializers.SerializerMethodField()
+    variants = ProductVariantSerializer(many=True, read_only=True)
     
     class Meta:
         model = Product
         fields = ['id', 'name', 'category', 'category_name', 'description', 
-                  'old_price', 'new_price', 'image']
+                  'old_price', 'new_price', 'image', 'image_srcset', 'stock', 'variants']
+        # Поля модели для ?fields= (см. api/fieldsets.py)
+        sparse_field_sources = {
+            'category': ['category__name'],
+            'image_srcset': ['image_variants'],
+        }
+    
+    def get_image_srcset(self, obj):
+        """srcset по форматам: {'webp': 'url 160w, url 320w', 'jpeg': ...}"""
+        if not obj.image_variants:
+            return None
+        request = self.context.get('request')
+        build_url = request.build_absolute_uri if request else None
+        formats = dict.fromkeys(variant['format'] for variant in obj.image_variants)
+        return {fmt: build_srcset(obj.image_variants, fmt, build_url) for fmt in formats}
     
     def to_representation(self, instance):
         """Для совместимости с фронтом"""
         data = super().to_representation(instance)
         # Добавляем category как строку для фронта
-        data['category'] = instance.category.name.lower()
+        if 'category' in data:
+            data['category'] = instance.category.name.lower()
         return data
 
 
@@ -34,7 +72,7 @@ class ProductCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'category', 'category_name', 'description', 
-                  'old_price', 'new_price', 'image']
+                  'old_price', 'new_price', 'image', 'stock']
     
     def create(self, validated_data):
         category_name = validated_data.pop('category_name', None)
@@ -60,30 +98,54 @@ class UserSerializer(serializers.ModelSerializer):
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
+    variant = ProductVariantSerializer(read_only=True)
+    variant_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = CartItem
-        fields = ['id', 'user', 'product', 'product_id', 'quantity', 'subtotal']
+        fields = ['id', 'user', 'product', 'product_id', 'variant', 'variant_id', 'quantity', 'subtotal']
         read_only_fields = ['user', 'subtotal']
     
+    def validate(self, data):
+        # Вариант должен принадлежать выбранному товару
+        variant_id = data.get('variant_id')
+        if variant_id and not ProductVariant.objects.filter(
+            id=variant_id, product_id=data.get('product_id')
+        ).exists():
+            raise serializers.ValidationError({'variant_id': 'Variant does not belong to product'})
+        return data
+    
     def create(self, validated_data):
         # Автоматически привязываем к текущему пользователю
         user = self.context['request'].user
         product_id = validated_data.pop('product_id')
+        variant_id = validated_data.pop('variant_id', None)
         product = Product.objects.get(id=product_id)
         
-        # Проверяем, есть ли уже такой товар в корзине
-        cart_item, created = CartItem.objects.get_or_create(
-            user=user,
-            product=product,
-            defaults={'quantity': validated_data.get('quantity', 1)}
-        )
+        quantity = validated_data.get('quantity', 1)
         
-        if not created:
+        # Проверяем, есть ли уже такой товар (в этом размере) в корзине
+        cart_item = CartItem.objects.filter(user=user, product=product, variant_id=variant_id).first()
+        new_quantity = quantity + (cart_item.quantity if cart_item else 0)
+        
+        # Бронируем остаток под новое количество
+        try:
+            sync_reservation(user, product.id, new_quantity, variant_id=variant_id)
+        except OutOfStock as exc:
+            raise serializers.ValidationError({
+                'error': 'Not enough stock',
+                'product_ids': exc.product_ids
+            })
+        
+        if cart_item:
             # Если товар уже в корзине, увеличиваем количество
-            cart_item.quantity += validated_data.get('quantity', 1)
+            cart_item.quantity = new_quantity
             cart_item.save()
+        else:
+            cart_item = CartItem.objects.create(
+                user=user, product=product, variant_id=variant_id, quantity=quantity
+            )
         
         return cart_item
 
@@ -92,52 +154,99 @@ class CartItemSerializer(serializers.ModelSerializer):
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
+    variant = ProductVariantSerializer(read_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = OrderItem
-        fields = ['id', 'order', 'product', 'product_id', 'quantity', 'subtotal']
-        read_only_fields = ['order', 'subtotal']
+        fields = ['id', 'order', 'product', 'product_id', 'variant', 'quantity', 'price', 'subtotal']
+        read_only_fields = ['order', 'price', 'subtotal']
+        sparse_field_sources = {
+            'subtotal': ['quantity', 'price'],
+        }
 
 
 # === Сериализатор заказа ===
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True)
     user = UserSerializer(read_only=True)
     
     class Meta:
         model = Order
-        fields = ['id', 'user', 'created_at', 'total', 'status', 'order_items']
-        read_only_fields = ['user', 'created_at', 'total']
+        fields = ['id', 'user', 'created_at', 'total', 'discount', 'coupon', 'status', 'order_items']
+        # Статус меняют только отмена и админка (events.set_status)
+        read_only_fields = ['user', 'created_at', 'total', 'discount', 'coupon', 'status']
+
+
+# === Краткий сериализатор заказа (список истории) ===
+class OrderSummarySerializer(serializers.ModelSerializer):
+    items_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Order
+        fields = ['id', 'created_at', 'status', 'total', 'items_count']
 
 
 # === Сериализатор создания заказа ===
 class OrderCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ['id', 'status']
+        fields = ['id', 'status', 'coupon', 'discount', 'total']
+        read_only_fields = ['status', 'discount', 'total']
+    
+    def validate_coupon(self, coupon):
+        coupon = normalize_code(coupon)
+        if coupon and coupon not in get_plan().coupons:
+            raise serializers.ValidationError('Invalid coupon')
+        return coupon or ''
     
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
         
+        # Копируем товары из корзины в заказ
+        cart_items = list(CartItem.objects.filter(user=user).select_related('product'))
+        
+        # Скидка по тем же правилам, что и в /api/cart/total/
+        pricing = price_cart(cart_items, validated_data.get('coupon'))
+        
         # Создаем заказ
-        order = Order.objects.create(user=user, **validated_data)
+        order = Order.objects.create(user=user, discount=pricing['discount'], **validated_data)
         
-        # Копируем товары из корзины в заказ
-        cart_items = CartItem.objects.filter(user=user)
+        # Списываем остатки; при нехватке вся транзакция откатывается
+        try:
+            commit_cart(user, {
+                (item.product_id, item.variant_id): item.quantity for item in cart_items
+            })
+        except OutOfStock as exc:
+            raise serializers.ValidationError({
+                'error': 'Not enough stock',
+                'product_ids': exc.product_ids
+            })
         
-        for cart_item in cart_items:
-            OrderItem.objects.create(
+        # Одним INSERT; сигналы суммы не срабатывают — считаем её один раз ниже
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
                 product=cart_item.product,
-                quantity=cart_item.quantity
+                variant_id=cart_item.variant_id,
+                quantity=cart_item.quantity,
+                price=cart_item.product.new_price
             )
+            for cart_item in cart_items
+        ])
         
         # Подсчитываем итоговую сумму
         order.calculate_total()
         
+        emit('order.created', {
+            'ids': [order.id],
+            'user_id': user.id,
+            'product_ids': sorted({item.product_id for item in cart_items}),
+        })
+        
         # Очищаем корзину
-        cart_items.delete()
+        CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
         
         return order
 
@@ -0,0 +1,104 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Category, Order, OrderItem, Product, Promotion
+from .outbox import emit
+from .price_history import record_prices, to_cents
+from .promotions import bump_promotion_version
+from .suggest import bump_catalog_version
+
+
+# === Версия каталога (индекс подсказок поиска) ===
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+# === Версия акций (план цен promotions.py) ===
+# Категории тоже: план раскрывает категорию акции на подкатегории
+@receiver([post_save, post_delete], sender=Promotion)
+@receiver([post_save, post_delete], sender=Category)
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+def promotions_changed(sender, **kwargs):
+    bump_promotion_version()
+
+
+# === История цен ===
+# Одиночные сохранения (форма и list_editable в админке, API); массовые
+# изменения цен пишут историю сами (ProductAdmin.apply_discount)
+@receiver(pre_save, sender=Product)
+def remember_price(sender, instance, update_fields=None, **kwargs):
+    instance._previous_price = None
+    if instance._state.adding or (update_fields is not None and 'new_price' not in update_fields):
+        return
+    instance._previous_price = (
+        Product.objects.filter(pk=instance.pk).values_list('new_price', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def record_price_change(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        record_prices([(instance.pk, instance.new_price)])
+    elif instance._previous_price is not None and to_cents(instance._previous_price) != to_cents(instance.new_price):
+        record_prices([(instance.pk, instance.new_price)])
+
+
+# === Outbox ===
+# Сигнал приходит в транзакции сохранения: админка атомарна сама,
+# во ViewSet'ах запись обёрнута в AtomicWriteMixin
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def emit_saved(sender, instance, **kwargs):
+    emit(f'{sender._meta.model_name}.changed', {'ids': [instance.pk]})
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def emit_deleted(sender, instance, **kwargs):
+    emit(f'{sender._meta.model_name}.deleted', {'ids': [instance.pk]})
+
+
+# === Сумма заказа ===
+# Order.total меняется на разницу одним UPDATE ... SET total = total + delta,
+# без пересчёта всех позиций: правки в OrderItemInline сразу видны в сумме.
+# bulk_create/update/delete сигналов не шлют — после них вызывайте
+# Order.calculate_total() (или reconcile_order_totals).
+def _add_to_total(order_id, delta):
+    if delta:
+        Order.objects.filter(pk=order_id).update(total=F('total') + delta)
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_line(sender, instance, **kwargs):
+    if instance.price is None:
+        instance.price = instance.product.new_price
+    instance._previous_line = None
+    if not instance._state.adding:
+        instance._previous_line = (
+            OrderItem.objects.filter(pk=instance.pk).values_list('order_id', 'price', 'quantity').first()
+        )
+
+
+@receiver(post_save, sender=OrderItem)
+def order_line_saved(sender, instance, **kwargs):
+    previous = instance._previous_line
+    if previous:
+        order_id, price, quantity = previous
+        if order_id != instance.order_id:
+            _add_to_total(order_id, -price * quantity)
+        else:
+            _add_to_total(order_id, instance.subtotal() - price * quantity)
+            return
+    _add_to_total(instance.order_id, instance.subtotal())
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_line_deleted(sender, instance, origin=None, **kwargs):
+    # Позиции удаляются вместе с заказом (каскад, архивация) — сумму не трогаем
+    if isinstance(origin, Order) or getattr(origin, 'model', None) is Order:
+        return
+    _add_to_total(instance.order_id, -instance.subtotal())
@@ -0,0 +1,234 @@
+"""
+Похожие товары по тексту (name + description) — для товаров без истории продаж.
+
+Признаки товара: слова названия (с двойным весом), слова описания и
+символьные триграммы слов названия («блузка» ~ «блузки»). Признаки
+хешируются (feature hashing) в BUCKETS корзин, взвешиваются TF-IDF и
+сворачиваются в плотный вектор из DIM float32 со знаком из хеша;
+векторы нормированы, поэтому похожесть — скалярное произведение.
+
+Индекс строит команда build_similarity_index и сохраняет в
+SIMILARITY_INDEX_DIR/<версия>/ (ids.npy, vectors.npy, idf.npy, meta.json),
+файл current указывает на действующую версию. Веб-процессы открывают
+vectors.npy через mmap и перечитывают индекс, когда меняется current.
+Инкрементальное обновление пересчитывает только товары, изменённые
+после прошлой сборки, со старыми IDF; полная пересборка обновляет и их.
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import zlib
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Product
+
+
+DIM = 256
+BUCKETS = 1 << 18
+SIGN_BIT = BUCKETS >> 1
+NAME_REPEAT = 2
+CHUNK_SIZE = 10000
+
+SIMILAR_LIMIT = 8
+MAX_SIMILAR_LIMIT = 50
+SIMILAR_CACHE_TIMEOUT = 15 * 60
+
+_WORD_RE = re.compile(r'\w+')
+
+
+# === Векторизация ===
+def _features(name, description):
+    words = _WORD_RE.findall(name.lower())
+    features = [f'w:{word}' for word in words] * NAME_REPEAT
+    for word in words:
+        padded = f'#{word}#'
+        features.extend(f'g:{padded[i:i + 3]}' for i in range(len(padded) - 2))
+    features.extend(f'w:{word}' for word in _WORD_RE.findall(description.lower()))
+    return features
+
+
+def _doc_terms(rows, memo):
+    """
+    rows — [(name, description)]. Возвращает плоские массивы
+    (doc, bucket, tf): уникальные признаки каждого документа.
+    memo — кеш хешей признаков на время сборки.
+    """
+    docs, buckets = [], []
+    for doc, (name, description) in enumerate(rows):
+        for feature in _features(name, description):
+            bucket = memo.get(feature)
+            if bucket is None:
+                bucket = memo[feature] = zlib.crc32(feature.encode()) & (BUCKETS - 1)
+            buckets.append(bucket)
+            docs.append(doc)
+
+    keys = np.array(docs, dtype=np.int64) * BUCKETS + np.array(buckets, dtype=np.int64)
+    keys, tf = np.unique(keys, return_counts=True)
+    return keys // BUCKETS, keys % BUCKETS, tf
+
+
+def _vectors(count, doc, bucket, tf, idf):
+    weight = (1 + np.log(tf)) * idf[bucket]
+    weight = np.where(bucket & SIGN_BIT, -weight, weight)
+    cells = doc * DIM + (bucket & (DIM - 1))
+    vectors = np.bincount(cells, weights=weight, minlength=count * DIM).reshape(count, DIM)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+def _batches(rows, size):
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+# === Хранение ===
+def _index_dir():
+    return settings.SIMILARITY_INDEX_DIR
+
+
+def _save(ids, vectors, idf, built_at):
+    index_dir = _index_dir()
+    version = str(time.time_ns())
+    path = index_dir / version
+    path.mkdir(parents=True)
+
+    np.save(path / 'ids.npy', ids)
+    np.save(path / 'vectors.npy', vectors)
+    np.save(path / 'idf.npy', idf)
+    (path / 'meta.json').write_text(json.dumps({
+        'built_at': built_at.isoformat(), 'products': len(ids), 'dim': DIM,
+    }))
+
+    # Переключаем current атомарно; старые версии удаляем
+    # (открытые через mmap файлы остаются доступны читателям)
+    pointer = index_dir / 'current.tmp'
+    pointer.write_text(version)
+    os.replace(pointer, index_dir / 'current')
+    for old in index_dir.iterdir():
+        if old.is_dir() and old.name != version:
+            shutil.rmtree(old, ignore_errors=True)
+    return version
+
+
+class SimilarityIndex:
+    def __init__(self, version):
+        path = _index_dir() / version
+        self.version = version
+        self.ids = np.load(path / 'ids.npy')
+        self.vectors = np.load(path / 'vectors.npy', mmap_mode='r')
+        self.idf = np.load(path / 'idf.npy')
+        self.meta = json.loads((path / 'meta.json').read_text())
+
+    def position(self, product_id):
+        position = int(np.searchsorted(self.ids, product_id))
+        if position < len(self.ids) and self.ids[position] == product_id:
+            return position
+        return None
+
+    def similar(self, product_id, limit):
+        position = self.position(product_id)
+        if position is None or len(self.ids) < 2:
+            return []
+
+        scores = self.vectors @ self.vectors[position]
+        scores[position] = -np.inf
+        limit = min(limit, len(scores) - 1)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [int(self.ids[i]) for i in top if scores[i] > 0]
+
+
+_loaded = {'version': None, 'index': None}
+
+
+def load_index():
+    """Действующий индекс или None, если он ещё не построен."""
+    try:
+        version = (_index_dir() / 'current').read_text().strip()
+    except FileNotFoundError:
+        return None
+    if _loaded['version'] != version:
+        _loaded['index'] = SimilarityIndex(version)
+        _loaded['version'] = version
+    return _loaded['index']
+
+
+# === Сборка ===
+def build_index():
+    """Полная сборка по всем товарам. Возвращает число товаров в индексе."""
+    built_at = timezone.now()
+    rows = (
+        Product.objects.order_by('id')
+        .values_list('id', 'name', 'description')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    memo, ids, chunks = {}, [], []
+    df = np.zeros(BUCKETS, dtype=np.int64)
+    for batch in _batches(rows, CHUNK_SIZE):
+        doc, bucket, tf = _doc_terms([(name, description) for _, name, description in batch], memo)
+        df += np.bincount(bucket, minlength=BUCKETS)
+        chunks.append((len(batch), doc, bucket, tf))
+        ids.extend(product_id for product_id, _, _ in batch)
+
+    idf = (np.log((1 + len(ids)) / (1 + df)) + 1).astype(np.float32)
+    vectors = np.concatenate(
+        [_vectors(*chunk, idf) for chunk in chunks] or [np.empty((0, DIM), dtype=np.float32)]
+    )
+    _save(np.array(ids, dtype=np.int64), vectors, idf, built_at)
+    return len(ids)
+
+
+def update_index():
+    """
+    Пересчитывает товары, изменённые после прошлой сборки, добавляет новые
+    и убирает удалённые. Возвращает число пересчитанных товаров.
+    """
+    index = load_index()
+    if index is None:
+        return build_index()
+
+    built_at = timezone.now()
+    changed = list(
+        Product.objects.filter(updated_at__gt=parse_datetime(index.meta['built_at']))
+        .values_list('id', 'name', 'description')
+    )
+    alive = np.fromiter(Product.objects.values_list('id', flat=True), dtype=np.int64)
+
+    keep = np.isin(index.ids, alive) & ~np.isin(index.ids, [row[0] for row in changed])
+    ids, vectors = index.ids[keep], np.asarray(index.vectors[keep])
+    if changed:
+        doc, bucket, tf = _doc_terms([(name, description) for _, name, description in changed], {})
+        ids = np.concatenate([ids, np.array([row[0] for row in changed], dtype=np.int64)])
+        vectors = np.concatenate([vectors, _vectors(len(changed), doc, bucket, tf, index.idf)])
+
+    order = np.argsort(ids, kind='stable')
+    _save(ids[order], vectors[order], index.idf, built_at)
+    return len(changed)
+
+
+def similar_product_ids(product_id, limit=SIMILAR_LIMIT):
+    """Id товаров с самым похожим названием и описанием."""
+    index = load_index()
+    if index is None:
+        return []
+
+    key = f'similar_products:{index.version}:{product_id}:{limit}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = index.similar(int(product_id), limit)
+        cache.set(key, ids, SIMILAR_CACHE_TIMEOUT)
+    return ids
@@ -0,0 +1,155 @@
+"""
+Подсказки для строки поиска: /api/products/suggest/?q=
+
+Индекс живёт в памяти процесса: отсортированный массив позиций
+«начало слова в названии товара», поиск — bisect по префиксу и
+короткий проход вперёд, без запросов к БД.
+
+Индекс строится лениво при первом запросе и перестраивается, когда
+меняется версия каталога (её поднимают сигналы сохранения/удаления
+Product и Category, см. signals.py) или индекс старше INDEX_MAX_AGE —
+на случай изменений в обход сигналов (bulk_create, другой процесс
+с локальным кешем). Перестройка идёт в фоновом потоке, запросы
+тем временем отвечают по старому индексу.
+"""
+
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Category, Product
+
+
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 20
+INDEX_MAX_AGE = 5 * 60
+
+# Ограничения памяти: индексируем начала первых MAX_WORDS слов названия,
+# всего не больше MAX_ENTRIES позиций
+MAX_WORDS = 12
+MAX_ENTRIES = 1_000_000
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return ' '.join(_WORD_RE.findall(text.casefold()))
+
+
+def catalog_version():
+    return cache.get(CATALOG_VERSION_KEY, 0)
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 1, None)
+
+
+class PrefixIndex:
+    """
+    keys[i] — нормализованное название товара ids[i]. entries — упакованные
+    (i << 8 | offset), отсортированные по keys[i][offset:]: каждое слово
+    названия (кроме дальних) — точка входа для префиксного поиска.
+    """
+
+    def __init__(self, rows, categories):
+        self.keys, self.names, self.ids = [], [], array('q')
+        starts = []
+        for product_id, name in rows:
+            key = normalize(name)[:255]
+            if not key:
+                continue
+            position = len(self.keys)
+            self.keys.append(key)
+            self.names.append(name)
+            self.ids.append(product_id)
+            offsets = [0] + [match.end() for match in re.finditer(' ', key)][:MAX_WORDS - 1]
+            starts.extend((position << 8) | offset for offset in offsets)
+            if len(starts) >= MAX_ENTRIES:
+                break
+
+        starts.sort(key=self._suffix)
+        self.entries = array('q', starts)
+        self.categories = sorted((normalize(name), category_id, name) for category_id, name in categories)
+
+    def _suffix(self, entry):
+        return self.keys[entry >> 8][entry & 0xff:]
+
+    def search(self, query, limit):
+        query = normalize(query)
+        if not query:
+            return [], []
+
+        products, seen = [], set()
+        position = bisect_left(self.entries, query, key=self._suffix)
+        while position < len(self.entries) and len(products) < limit:
+            entry = self.entries[position]
+            if not self._suffix(entry).startswith(query):
+                break
+            index = entry >> 8
+            if index not in seen:
+                seen.add(index)
+                products.append({'id': self.ids[index], 'name': self.names[index]})
+            position += 1
+
+        categories = [
+            {'id': category_id, 'name': name}
+            for key, category_id, name in self.categories
+            if key.startswith(query)
+        ][:limit]
+        return products, categories
+
+
+_state = {'index': None, 'version': None, 'built': 0.0}
+_build_lock = threading.Lock()
+
+
+def _build():
+    version = catalog_version()
+    index = PrefixIndex(
+        Product.objects.order_by('id').values_list('id', 'name').iterator(chunk_size=5000),
+        Category.objects.values_list('id', 'name'),
+    )
+    _state.update(index=index, version=version, built=time.monotonic())
+    return index
+
+
+def _rebuild_in_background():
+    try:
+        _build()
+    finally:
+        # Соединение с БД у потока своё — закрываем его
+        connection.close()
+        _build_lock.release()
+
+
+def get_index():
+    index = _state['index']
+    stale = (
+        index is None
+        or _state['version'] != catalog_version()
+        or time.monotonic() - _state['built'] > INDEX_MAX_AGE
+    )
+    if not stale:
+        return index
+
+    if index is None:
+        with _build_lock:
+            return _state['index'] or _build()
+    if _build_lock.acquire(blocking=False):
+        threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    return index
+
+
+def suggestions(query, limit=SUGGEST_LIMIT):
+    products, categories = get_index().search(query, limit)
+    return {'products': products, 'categories': categories}
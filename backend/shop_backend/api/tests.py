@@ -1,3 +1,1219 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import runpy
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+
+from . import promotions, suggest
+from .archive import archive_batch
+from .compression import store_precompressed
+from .events import set_status
+from .exports import ORDER_EXPORT_HEADER
+from .inventory import OutOfStock, commit_cart, release_expired, sync_reservation
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, CartItem, Category, Order, OrderItem, OutboxEvent, Product,
+    ProductCooccurrence, ProductVariant, Promotion, StockReservation, subtree_q,
+)
+from .outbox import BATCH_IDS, emit, emit_many, outbox_stats, relay_batch
+from .recommendations import build_cooccurrence
+from .similarity import SIMILAR_LIMIT, build_index, load_index, similar_product_ids, update_index
+from .suggest import SUGGEST_LIMIT
+from .throttling import AuthRateThrottle, CartRateThrottle
+
+
+def make_product(stock=10, category=None, **kwargs):
+    if category is None:
+        category = Category.objects.get_or_create(name='Test')[0]
+    return Product.objects.create(
+        category=category, name=kwargs.pop('name', 'Product'),
+        old_price=kwargs.pop('old_price', 20), new_price=kwargs.pop('new_price', 10),
+        stock=stock, **kwargs
+    )
+
+
+def run_in_threads(target, count):
+    """Запускает target(i) в count потоках одновременно; у каждого потока своё соединение."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        try:
+            barrier.wait()
+            results[index] = target(index)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# === Пароли и пользователи ===
+class PasswordHasherProfileTests(TestCase):
+    SETTINGS_FILE = Path(__file__).resolve().parent.parent / 'shop_backend' / 'settings.py'
+
+    def load_settings(self, profile):
+        with mock.patch.dict(os.environ, {'DJANGO_PASSWORD_HASHER_PROFILE': profile}):
+            return runpy.run_path(str(self.SETTINGS_FILE))
+
+    def test_fast_profile_still_checks_existing_hashes(self):
+        hashers = self.load_settings('fast')['PASSWORD_HASHERS']
+        self.assertEqual(hashers[0], 'django.contrib.auth.hashers.MD5PasswordHasher')
+
+        with override_settings(PASSWORD_HASHERS=hashers):
+            existing = make_password('secret123', hasher='pbkdf2_sha256')
+            self.assertTrue(check_password('secret123', existing))
+            self.assertTrue(make_password('secret123').startswith('md5$'))
+
+    def test_default_profile_keeps_django_hashers(self):
+        self.assertNotIn('PASSWORD_HASHERS', self.load_settings('default'))
+
+    def test_create_users(self):
+        User.objects.create_user('load2', password='old')
+
+        call_command('create_users', 3, prefix='load', password='secret123', workers=1, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(User.objects.values_list('username', flat=True)), ['load1', 'load2', 'load3']
+        )
+        self.assertTrue(User.objects.get(username='load1').check_password('secret123'))
+        self.assertEqual(User.objects.get(username='load3').email, 'load3@example.com')
+        # Существующий логин пропущен, его пароль не перезаписан
+        self.assertTrue(User.objects.get(username='load2').check_password('old'))
+
+
+# === Лимиты запросов (throttling.py) ===
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def login(self):
+        return self.client.post('/api/login/', {'username': 'nobody', 'password': 'wrong-password'},
+                                content_type='application/json')
+
+    def test_login_is_limited_per_ip(self):
+        for remaining in range(9, -1, -1):
+            response = self.login()
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['X-RateLimit-Remaining'], str(remaining))
+
+        response = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_previous_window_decays(self):
+        throttle = AuthRateThrottle()
+        request = RequestFactory().post('/api/login/')
+
+        def allowed():
+            return throttle.allow_request(Request(request), None)
+
+        with mock.patch.object(throttle, 'timer', return_value=60 * 1000 + 59):
+            self.assertEqual(sum(allowed() for _ in range(12)), 10)
+        # Начало следующего окна: 10 * 59/60 от предыдущего — место для одного запроса
+        with mock.patch.object(throttle, 'timer', return_value=60 * 1001 + 1):
+            self.assertEqual(sum(allowed() for _ in range(3)), 1)
+        # Середина окна: от предыдущего в счёт только половина
+        with mock.patch.object(throttle, 'timer', return_value=60 * 1001 + 30):
+            self.assertEqual(sum(allowed() for _ in range(10)), 4)
+
+    def test_state_is_two_counters_per_client(self):
+        throttle = CartRateThrottle()
+        request = Request(RequestFactory().post('/api/cart/add_item/'))
+        spy = mock.Mock(wraps=cache)
+
+        with mock.patch.object(throttle, 'cache', spy):
+            for now in (60 * 1000 + 1, 60 * 1001 + 1):
+                with mock.patch.object(throttle, 'timer', return_value=now):
+                    for _ in range(500):
+                        throttle.allow_request(request, None)
+
+        keys = set()
+        for call in spy.method_calls:
+            argument = call.args[0]
+            keys.update(argument if isinstance(argument, list) else [argument])
+        self.assertEqual(keys, {f'{throttle.key}:{window}' for window in (999, 1000, 1001)})
+        self.assertEqual(cache.get(f'{throttle.key}:1000'), 120)
+
+    def test_rate_limit_headers_are_exposed_to_cors(self):
+        response = self.client.post('/api/login/', {}, content_type='application/json',
+                                    headers={'Origin': 'http://localhost:3000'})
+
+        exposed = response['Access-Control-Expose-Headers'].split(', ')
+        for header in ('X-RateLimit-Remaining', 'Retry-After', 'Idempotent-Replayed'):
+            self.assertIn(header, exposed)
+
+
+# === Изображения товаров (images.py) ===
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        source_dir, media_dir = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(source_dir.cleanup)
+        self.addCleanup(media_dir.cleanup)
+        self.source_dir, self.media_dir = Path(source_dir.name), Path(media_dir.name)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=self.media_dir, PRODUCT_IMAGE_WIDTHS=[160, 320], PRODUCT_IMAGE_FORMATS=['webp', 'jpeg'],
+        ))
+
+    def test_builds_variants_and_srcset(self):
+        Image.new('RGBA', (200, 100), (255, 0, 0, 128)).save(self.source_dir / 'product_1.png')
+        product = make_product(image='http://localhost:3000/assets/product_1.png')
+        missing = make_product(image='http://localhost:3000/assets/product_2.png')
+
+        call_command('build_image_variants', source=str(self.source_dir), workers=1, stdout=StringIO())
+
+        product.refresh_from_db()
+        # Исходник шириной 200 до 320 не растягиваем
+        self.assertEqual(
+            sorted((variant['format'], variant['width']) for variant in product.image_variants),
+            [('jpeg', 160), ('jpeg', 200), ('webp', 160), ('webp', 200)],
+        )
+        with Image.open(self.media_dir / 'products' / str(product.id) / '160.jpg') as image:
+            self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (160, 80)))
+        missing.refresh_from_db()
+        self.assertFalse(missing.image_variants)
+
+        srcset = self.client.get(f'/api/products/{product.id}/').data['image_srcset']
+        self.assertEqual(
+            srcset['webp'],
+            f'http://testserver/media/products/{product.id}/160.webp 160w, '
+            f'http://testserver/media/products/{product.id}/200.webp 200w',
+        )
+
+
+# === ?fields= / ?expand= (fieldsets.py) ===
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        self.client.force_login(self.user)
+        self.product = make_product(name='Linen Shirt')
+        self.order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+
+    def test_product_fields(self):
+        response = self.client.get(f'/api/products/{self.product.id}/', {'fields': 'id,name,category'})
+
+        self.assertEqual(response.json(), {'id': self.product.id, 'name': 'Linen Shirt', 'category': 'test'})
+
+    def test_nested_order_fields(self):
+        response = self.client.get(
+            f'/api/orders/{self.order.id}/', {'fields': 'id,user,order_items.quantity,order_items.product.name'}
+        )
+
+        self.assertEqual(response.json(), {
+            'id': self.order.id,
+            'user': self.user.id,
+            'order_items': [{'quantity': 2, 'product': {'name': 'Linen Shirt'}}],
+        })
+
+    def test_expand_without_fields(self):
+        response = self.client.get(f'/api/orders/{self.order.id}/', {'expand': 'user'})
+
+        data = response.json()
+        self.assertEqual(data['user']['username'], 'buyer')
+        # Нераскрытые вложенные объекты — первичные ключи
+        self.assertEqual(data['order_items'], [OrderItem.objects.get().id])
+
+
+# === История заказов (pagination.py) ===
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        self.client.force_login(self.user)
+        self.product = make_product()
+
+    def make_order(self, user, minutes_ago, lines=1):
+        order = Order.objects.create(user=user)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        for _ in range(lines):
+            OrderItem.objects.create(order=order, product=self.product, quantity=1)
+        return order
+
+    def test_pages_of_summaries_newest_first(self):
+        orders = [self.make_order(self.user, minutes_ago, lines=2) for minutes_ago in (30, 10, 20, 40, 50)]
+        self.make_order(User.objects.create_user('other'), 5)
+
+        pages, url = [], '/api/orders/?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data['results'])
+            url = data['next']
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        expected = [orders[1].id, orders[2].id, orders[0].id, orders[3].id, orders[4].id]
+        self.assertEqual([summary['id'] for page in pages for summary in page], expected)
+        self.assertEqual(set(pages[0][0]), {'id', 'created_at', 'status', 'total', 'items_count'})
+        self.assertEqual(pages[0][0]['items_count'], 2)
+
+
+# === Выгрузка заказов из админки ===
+class OrderAdminExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        buyer = User.objects.create_user('buyer', 'buyer@example.com')
+        product = make_product(name='Linen Shirt')
+        variant = ProductVariant.objects.create(product=product, sku='LS-M', size='M', stock=3)
+        self.delivered = Order.objects.create(user=buyer, status='Delivered')
+        OrderItem.objects.create(order=self.delivered, product=product, quantity=2, price=10)
+        OrderItem.objects.create(order=self.delivered, product=product, variant=variant, quantity=1, price=12)
+        self.pending = Order.objects.create(user=buyer)
+
+    def rows(self, response):
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_export_follows_changelist_filters(self):
+        response = self.client.get('/admin/api/order/export/', {'status__exact': 'Delivered'})
+
+        header, *lines = self.rows(response)
+        self.assertEqual(header, ORDER_EXPORT_HEADER)
+        columns = ['order_id', 'username', 'status', 'product_name', 'sku', 'quantity', 'unit_price', 'subtotal']
+        self.assertEqual(
+            [[dict(zip(header, line))[name] for name in columns] for line in lines],
+            [
+                [str(self.delivered.id), 'buyer', 'Delivered', 'Linen Shirt', '', '2', '10.00', '20.00'],
+                [str(self.delivered.id), 'buyer', 'Delivered', 'Linen Shirt', 'LS-M', '1', '12.00', '12.00'],
+            ],
+        )
+
+    def test_action_exports_selected_orders(self):
+        response = self.client.post('/admin/api/order/', {
+            'action': 'export_as_csv', '_selected_action': [self.pending.id],
+        })
+
+        rows = self.rows(response)
+        # Заказ без позиций — одна строка с пустыми полями позиции
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], str(self.pending.id))
+        self.assertEqual(rows[1][6:], [''] * 6)
+
+
+# === Гостевая корзина (guest_cart.py) ===
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shirt, self.boots = make_product(name='Linen Shirt'), make_product(name='Leather Boots')
+        self.user = User.objects.create_user('buyer', password='secret123')
+        CartItem.objects.create(user=self.user, product=self.shirt, quantity=1)
+
+    def add(self, product):
+        return self.client.post('/api/cart/add_item/', {'product_id': product.id}, content_type='application/json')
+
+    def test_guest_cart_merges_on_login(self):
+        for product in (self.shirt, self.shirt, self.boots):
+            self.assertEqual(self.add(product).status_code, 200)
+        # Гость пишет только в кеш
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 1)
+
+        response = self.client.post('/api/login/', {'username': 'buyer', 'password': 'secret123'},
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies['guest_cart'].value, '')
+        self.assertEqual(
+            dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+            {self.shirt.id: 3, self.boots.id: 1},
+        )
+        self.assertEqual(
+            dict(StockReservation.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+            {self.shirt.id: 3, self.boots.id: 1},
+        )
+
+
+# === Остатки и брони (inventory.py) ===
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.product = make_product(stock=5)
+        self.client.force_login(self.user)
+
+    def stock(self):
+        self.product.refresh_from_db(fields=['stock'])
+        return self.product.stock
+
+    def post(self, url, data=None):
+        return self.client.post(url, data or {}, content_type='application/json')
+
+    def add_item(self):
+        return self.post('/api/cart/add_item/', {'product_id': self.product.id})
+
+    def expire_reservations(self):
+        return release_expired(now=timezone.now() + timedelta(days=1))
+
+    def test_add_item_reserves_stock(self):
+        self.add_item()
+        self.add_item()
+
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(StockReservation.objects.get(user=self.user).quantity, 2)
+
+    def test_add_item_without_stock_returns_409(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+
+        response = self.add_item()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['product_ids'], [self.product.id])
+
+    def test_expired_reservations_return_stock(self):
+        sync_reservation(self.user, self.product.id, 3)
+
+        self.assertEqual(release_expired(now=timezone.now()), 0)
+        self.assertEqual(self.expire_reservations(), 1)
+        self.assertEqual(self.stock(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_remove_item_after_expiry_never_takes_stock(self):
+        self.add_item()
+        self.add_item()
+        self.expire_reservations()
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+
+        response = self.post('/api/cart/remove_item/', {'product_id': self.product.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity'], 1)
+        self.assertEqual(self.stock(), 0)
+
+    def test_checkout_commits_reservation(self):
+        self.add_item()
+        self.add_item()
+
+        response = self.post('/api/orders/')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(OrderItem.objects.get().quantity, 2)
+
+    def test_checkout_without_stock_rolls_back(self):
+        self.add_item()
+        self.expire_reservations()
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+
+        response = self.post('/api/orders/')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_cancel_restocks_once(self):
+        self.add_item()
+        self.add_item()
+        order_id = self.post('/api/orders/').json()['id']
+
+        for _ in range(2):
+            response = self.post(f'/api/orders/{order_id}/cancel/')
+            self.assertEqual(response.json()['status'], 'Cancelled')
+
+        self.assertEqual(self.stock(), 5)
+
+    def test_cancelled_order_is_final(self):
+        self.add_item()
+        order_id = self.post('/api/orders/').json()['id']
+        self.post(f'/api/orders/{order_id}/cancel/')
+
+        self.assertEqual(set_status(Order.objects.filter(pk=order_id), 'Pending'), 0)
+        self.client.patch(f'/api/orders/{order_id}/', {'status': 'Pending'}, content_type='application/json')
+
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'Cancelled')
+        self.assertEqual(self.stock(), 5)
+
+    def test_delivered_order_cannot_be_cancelled(self):
+        self.add_item()
+        order_id = self.post('/api/orders/').json()['id']
+        set_status(Order.objects.filter(pk=order_id), 'Delivered')
+
+        response = self.post(f'/api/orders/{order_id}/cancel/')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(), 4)
+
+
+# === События заказов (SSE) ===
+@override_settings(ORDER_EVENTS_HEARTBEAT=0.05, ORDER_EVENTS_MAX_DURATION=0.2)
+class OrderEventsTests(TestCase):
+    def test_wsgi_request_gets_501(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+
+        self.assertEqual(self.client.get('/api/orders/events/').status_code, 501)
+
+    async def test_stream_is_bounded(self):
+        user = await User.objects.acreate(username='buyer')
+        await Order.objects.acreate(user=user)
+        await self.async_client.aforce_login(user)
+
+        response = await self.async_client.get('/api/orders/events/')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: snapshot', body)
+        self.assertIn(': keepalive', body)
+
+
+# === Варианты (SKU) ===
+class VariantCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(stock=0)
+        self.variant = ProductVariant.objects.create(product=self.product, sku='T-M', size='M', stock=3)
+
+    def add_item(self, **data):
+        return self.client.post(
+            '/api/cart/add_item/', {'product_id': self.product.id, **data}, content_type='application/json'
+        )
+
+    def test_variant_is_required_for_product_with_variants(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+
+        self.assertEqual(self.add_item().status_code, 400)
+        self.assertEqual(self.add_item(variant_id=self.variant.id).status_code, 200)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 2)
+
+    def test_guest_needs_variant_too(self):
+        self.assertEqual(self.add_item().status_code, 400)
+
+
+# === Дерево категорий ===
+class CategoryTreeTests(TestCase):
+    def test_subtree_does_not_match_sibling_with_same_digits(self):
+        root = Category.objects.create(name='Root')
+        # path '<root>1/' начинается с тех же цифр, что и '<root>/'
+        Category.objects.create(pk=root.pk * 10 + 1, name='Sibling')
+        child = Category.objects.create(name='Child', parent=root)
+
+        subtree = set(Category.objects.filter(subtree_q(root.path)).values_list('pk', flat=True))
+
+        self.assertEqual(subtree, {root.pk, child.pk})
+
+    @skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+    def test_subtree_uses_path_index(self):
+        root = Category.objects.create(name='Root')
+
+        for queryset in (
+            Category.objects.filter(subtree_q(root.path)),
+            Product.objects.filter(subtree_q(root.path, prefix='category__')),
+        ):
+            plan = queryset.explain()
+            self.assertIn('INDEX api_category_path', plan)
+            self.assertNotIn('SCAN api_category', plan)
+            self.assertNotIn('SCAN api_product', plan)
+
+    def test_move_rewrites_descendant_paths(self):
+        women = Category.objects.create(name='Women')
+        men = Category.objects.create(name='Men')
+        tops = Category.objects.create(name='Tops', parent=women)
+        shirts = Category.objects.create(name='Shirts', parent=tops)
+        product = make_product(category=shirts)
+
+        tops.parent = men
+        tops.save()
+
+        shirts.refresh_from_db()
+        self.assertEqual(shirts.path, f'{men.pk}/{tops.pk}/{shirts.pk}/')
+        self.assertEqual(list(Product.objects.filter(subtree_q(men.path, prefix='category__'))), [product])
+        self.assertFalse(Product.objects.filter(subtree_q(women.path, prefix='category__')).exists())
+
+
+# === Фасеты каталога ===
+class CategoryFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.women = Category.objects.create(name='Women')
+        self.dresses = Category.objects.create(name='Dresses', parent=self.women)
+        make_product(category=self.women)
+        make_product(category=self.dresses)
+        make_product(category=self.dresses)
+
+    def facets(self, **params):
+        response = self.client.get('/api/products/', {'facets': 'true', **params})
+        return {row['name']: row['count'] for row in json.loads(response.content)['facets']['category']}
+
+    def test_parent_counts_include_subcategories(self):
+        self.assertEqual(self.facets(), {'Women': 3, 'Dresses': 2})
+
+    def test_counts_match_subtree_filter(self):
+        response = self.client.get('/api/products/', {'category': self.women.id})
+        self.assertEqual(len(json.loads(response.content)), self.facets()['Women'])
+
+
+# === Общий HTTP-кеш ===
+class CacheControlTests(TestCase):
+    def test_responses_with_stock_expire_quickly_in_shared_cache(self):
+        product = make_product()
+
+        for url in ('/api/products/', f'/api/products/{product.id}/'):
+            cache_control = self.client.get(url)['Cache-Control']
+            self.assertIn('s-maxage=60', cache_control)
+
+
+# === Outbox (outbox.py) ===
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.delivered = []
+        self.handlers = self.enterContext(
+            mock.patch('api.outbox._handlers', return_value=[lambda event: self.delivered.append(event.topic)])
+        )
+
+    def test_event_exists_only_if_change_commits(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            make_product()
+            raise RuntimeError
+
+        product = make_product()
+
+        self.assertEqual(list(OutboxEvent.objects.values_list('topic', 'payload')), [
+            ('category.changed', {'ids': [product.category_id]}),
+            ('product.changed', {'ids': [product.id]}),
+        ])
+
+    def test_relay_delivers_in_order_and_retries_failed_batch(self):
+        emit('product.changed', {'ids': [1]})
+        emit_many('product.deleted', range(BATCH_IDS + 1))
+        self.handlers.return_value = [mock.Mock(side_effect=ConnectionError)]
+
+        with self.assertRaises(ConnectionError):
+            relay_batch()
+        self.assertEqual(outbox_stats()['pending'], 3)
+
+        self.handlers.return_value = [lambda event: self.delivered.append(event.topic)]
+        self.assertEqual(len(relay_batch()), 3)
+
+        self.assertEqual(self.delivered, ['product.changed', 'product.deleted', 'product.deleted'])
+        self.assertEqual(outbox_stats()['pending'], 0)
+        self.assertEqual(relay_batch(), [])
+
+
+class StubPurger:
+    def __init__(self):
+        self.purged = []
+
+    def purge(self, keys):
+        self.purged.append(keys)
+
+
+class CachePurgeTests(TestCase):
+    def setUp(self):
+        self.purger = StubPurger()
+        self.enterContext(mock.patch('api.cache_tags.get_purger', return_value=self.purger))
+
+    def test_category_rename_purges_its_product_cards(self):
+        category = Category.objects.create(name='Shoes')
+        first, second = make_product(category=category), make_product(category=category)
+        other = make_product()
+        relay_batch()
+        self.purger.purged.clear()
+
+        detail = self.client.get(f'/api/products/{first.id}/')
+        self.assertEqual(detail.data['category'], 'shoes')
+        self.assertIn(f'product-{first.id}', detail['Surrogate-Key'].split())
+
+        category.name = 'Boots'
+        category.save()
+        relay_batch()
+
+        self.assertEqual(self.purger.purged, [[
+            f'category-{category.id}', f'product-{first.id}', f'product-{second.id}',
+            'category-list', 'product-list',
+        ]])
+        self.assertNotIn(f'product-{other.id}', self.purger.purged[0])
+
+
+# === Кеш сжатых ответов (compression.py) ===
+class PrecompressedListTests(TestCase):
+    CATALOG_PRODUCTS = 10_000
+
+    def setUp(self):
+        cache.clear()
+        self.store = self.enterContext(mock.patch('api.views.store_precompressed', wraps=store_precompressed))
+
+    def get(self, query='', **headers):
+        return self.client.get(f'/api/products/{query}', headers=headers)
+
+    def test_hit_serves_compressed_bytes(self):
+        make_product()
+        identity = self.get().content
+
+        response = self.get(**{'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(self.store.call_count, 1)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), identity)
+
+    def test_param_order_shares_entry(self):
+        self.get('?min_price=1&max_price=100')
+        self.get('?max_price=100&min_price=1')
+
+        self.assertEqual(self.store.call_count, 1)
+
+    def test_unknown_params_are_not_cached(self):
+        make_product()
+
+        for index in range(3):
+            response = self.get(f'?utm_source={index}')
+            self.assertEqual(len(json.loads(response.content)), 1)
+
+        self.store.assert_not_called()
+
+    def create_catalog(self, count):
+        category = Category.objects.get_or_create(name='Test')[0]
+        Product.objects.bulk_create(
+            Product(category=category, name=f'Product {index}', description='Description ' * 20,
+                    old_price=20, new_price=10)
+            for index in range(count)
+        )
+
+    def test_full_catalog_is_smaller_on_the_wire(self):
+        self.create_catalog(self.CATALOG_PRODUCTS)
+        identity = self.get()
+        self.assertEqual(len(json.loads(identity.content)), self.CATALOG_PRODUCTS)
+
+        for encoding in ('gzip', 'br'):
+            with self.subTest(encoding=encoding):
+                response = self.get(**{'Accept-Encoding': encoding})
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertLess(len(response.content) * 10, len(identity.content))
+
+        self.assertEqual(self.store.call_count, 1)
+
+    def test_admin_html_is_not_compressed(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+
+        response = self.client.get('/admin/', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.content), settings.COMPRESSION_MIN_SIZE)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @tag('benchmark')
+    def test_hit_benchmark(self):
+        self.create_catalog(self.CATALOG_PRODUCTS)
+        started = time.perf_counter()
+        self.get(**{'Accept-Encoding': 'br, gzip'})
+        miss = time.perf_counter() - started
+
+        hits = 50
+        started = time.perf_counter()
+        for _ in range(hits):
+            self.get(**{'Accept-Encoding': 'br, gzip'})
+        hit = (time.perf_counter() - started) / hits
+
+        print(f'\nprecompressed list: hit {hit * 1000:.2f} ms, miss {miss * 1000:.2f} ms')
+
+
+# === Выгрузка каталога ===
+class CatalogExportTests(TestCase):
+    EXPORT_ROWS = 500_000
+    MAX_PEAK_MEMORY = 10 * 1024 * 1024
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def export(self, **params):
+        response = self.client.get('/api/products/export/', {'type': 'ndjson', **params})
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_since_includes_stock_changes(self):
+        product = make_product(stock=5)
+        since = timezone.now()
+        self.assertEqual(self.export(since=since.isoformat()), [])
+
+        sync_reservation(User.objects.create_user('buyer'), product.id, 2)
+
+        rows = self.export(since=since.isoformat())
+        self.assertEqual([(row['id'], row['stock']) for row in rows], [(product.id, 3)])
+
+    @tag('slow')
+    def test_memory_does_not_grow_with_export_size(self):
+        # Долгий (около минуты на SQLite): python manage.py test api --exclude-tag slow
+        category = Category.objects.create(name='Bulk')
+        Product.objects.bulk_create(
+            (
+                Product(category=category, name=f'Product {index}', old_price=20, new_price=10, stock=1)
+                for index in range(self.EXPORT_ROWS)
+            ),
+            batch_size=5000,
+        )
+        response = self.client.get('/api/products/export/', {'type': 'csv'})
+
+        tracemalloc.start()
+        try:
+            lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(lines, self.EXPORT_ROWS + 1)
+        self.assertLess(peak, self.MAX_PEAK_MEMORY, f'peak {peak / 1024 / 1024:.1f} MiB')
+
+
+# === Рекомендации ===
+class RelatedProductsTests(TestCase):
+    def test_invalid_and_unknown_products(self):
+        self.assertEqual(self.client.get('/api/products/abc/related/').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/999/related/').status_code, 404)
+
+    def test_product_without_pairs(self):
+        product = make_product()
+
+        response = self.client.get(f'/api/products/{product.id}/related/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+
+class CooccurrenceBuildTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer')
+        self.a, self.b, self.c, self.d = (make_product(name=name) for name in 'ABCD')
+
+    def make_order(self, products, minutes_ago=60, **kwargs):
+        order = Order.objects.create(user=self.user, **kwargs)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=product, price=10) for product in products)
+        return order
+
+    def pairs(self):
+        return dict(
+            ((product, related), orders)
+            for product, related, orders in ProductCooccurrence.objects.values_list('product', 'related', 'orders')
+        )
+
+    def test_counts_pairs_and_ranks_related(self):
+        a, b, c, d = self.a, self.b, self.c, self.d
+        self.make_order([a, b])
+        self.make_order([a, b, c, b])
+        self.make_order([a, c])
+        self.make_order([a, b])
+        self.make_order([a, d], status='Cancelled')
+
+        self.assertEqual(build_cooccurrence(chunk_size=2), 4)
+
+        self.assertEqual(self.pairs(), {
+            (a.id, b.id): 3, (b.id, a.id): 3, (a.id, c.id): 2, (c.id, a.id): 2,
+            (b.id, c.id): 1, (c.id, b.id): 1,
+        })
+        response = self.client.get(f'/api/products/{a.id}/related/')
+        self.assertEqual([item['id'] for item in response.json()], [b.id, c.id])
+
+    def test_late_commit_with_lower_id_is_counted(self):
+        self.make_order([self.a, self.b], id=200)
+        self.assertEqual(build_cooccurrence(), 1)
+
+        # Оформлен раньше, закоммичен позже: id меньше уже учтённого
+        self.make_order([self.a, self.c], id=150, minutes_ago=30)
+        # Ещё в пределах SAFETY_LAG — ждёт следующего запуска
+        self.make_order([self.a, self.d], minutes_ago=1)
+
+        self.assertEqual(build_cooccurrence(), 1)
+        self.assertEqual(self.pairs()[(self.a.id, self.c.id)], 1)
+        self.assertNotIn((self.a.id, self.d.id), self.pairs())
+
+        self.assertEqual(build_cooccurrence(lag=timedelta(0)), 1)
+        self.assertEqual(self.pairs()[(self.a.id, self.d.id)], 1)
+
+
+# === Похожие товары (similarity.py) ===
+class SimilarityIndexTests(TestCase):
+    BENCHMARK_PRODUCTS = 20_000
+
+    def setUp(self):
+        cache.clear()
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        self.enterContext(override_settings(SIMILARITY_INDEX_DIR=Path(index_dir.name)))
+
+    def test_similar_by_name_and_description(self):
+        blouse = make_product(name='Striped Peplum Blouse', description='Striped cotton blouse')
+        similar = make_product(name='Striped Flutter Blouse', description='Light cotton blouse')
+        make_product(name='Leather Boots', description='Winter boots')
+        build_index()
+
+        self.assertEqual(similar_product_ids(blouse.id, 1), [similar.id])
+        self.assertEqual(self.client.get('/api/products/abc/similar/').status_code, 400)
+
+    def test_unknown_product(self):
+        make_product(name='Linen Shirt')
+        build_index()
+
+        self.assertEqual(self.client.get('/api/products/999/similar/').status_code, 404)
+
+    def test_update_picks_up_changed_products(self):
+        shirt = make_product(name='Linen Shirt', description='Linen')
+        boots = make_product(name='Leather Boots', description='Leather')
+        build_index()
+        self.assertEqual(similar_product_ids(shirt.id), [])
+
+        boots.name, boots.description = 'Linen Trousers', 'Linen'
+        boots.save()
+        update_index()
+
+        self.assertEqual(similar_product_ids(shirt.id), [boots.id])
+
+    @tag('benchmark')
+    def test_query_benchmark(self):
+        category = Category.objects.get_or_create(name='Test')[0]
+        words = ['striped', 'cotton', 'linen', 'blouse', 'dress', 'shirt', 'boots', 'leather', 'summer', 'winter']
+        Product.objects.bulk_create(
+            (
+                Product(
+                    category=category, old_price=20, new_price=10,
+                    name=f'{words[index % 10]} {words[index // 10 % 10]} {words[index // 100 % 10]} {index}',
+                    description=f'{words[index // 1000 % 10]} {words[index % 7]}',
+                )
+                for index in range(self.BENCHMARK_PRODUCTS)
+            ),
+            batch_size=5000,
+        )
+        build_index()
+        index = load_index()
+        queries = index.ids[:200]
+
+        started = time.perf_counter()
+        for product_id in queries:
+            self.assertTrue(index.similar(int(product_id), SIMILAR_LIMIT))
+        elapsed = (time.perf_counter() - started) / len(queries)
+
+        print(f'\nsimilar products: {elapsed * 1000:.2f} ms per query')
+
+
+# === Подсказки поиска (suggest.py) ===
+class SuggestTests(TransactionTestCase):
+    # Фоновая перестройка индекса читает БД своим соединением — данные должны быть закоммичены
+    INDEX_PRODUCTS = 20_000
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.dict(suggest._state, {'index': None, 'version': None, 'built': 0.0}))
+
+    def suggest(self, query):
+        return self.client.get('/api/products/suggest/', {'q': query}).json()
+
+    def test_prefix_of_any_word(self):
+        blouse = make_product(name='Striped Peplum Blouse')
+        make_product(name='Leather Boots')
+
+        self.assertEqual(self.suggest('pep')['products'], [{'id': blouse.id, 'name': 'Striped Peplum Blouse'}])
+        self.assertEqual(self.suggest('STRIPED  pe')['products'][0]['id'], blouse.id)
+        self.assertEqual(self.suggest('Test')['categories'][0]['name'], 'Test')
+        self.assertEqual(self.suggest('xyz')['products'], [])
+
+    def test_catalog_change_rebuilds_index(self):
+        make_product(name='Leather Boots')
+        self.assertEqual(self.suggest('linen')['products'], [])
+
+        linen = make_product(name='Linen Shirt')
+
+        # Перестройка идёт в фоне: дожидаемся её
+        self.suggest('linen')
+        with suggest._build_lock:
+            pass
+        self.assertEqual(self.suggest('linen')['products'][0]['id'], linen.id)
+
+    def test_search_reads_only_the_prefix_range(self):
+        words = ['striped', 'cotton', 'linen', 'blouse', 'dress', 'shirt', 'boots', 'leather', 'summer', 'winter']
+        index = suggest.PrefixIndex(
+            (
+                (index, f'{words[index % 10]} {words[index // 10 % 10]} {words[index // 100 % 10]} {index}')
+                for index in range(self.INDEX_PRODUCTS)
+            ),
+            [],
+        )
+        # bisect — log2(n) сравнений, дальше только строки с префиксом и одна за ним
+        max_reads = len(index.entries).bit_length() + 3 * SUGGEST_LIMIT
+
+        for query in [word[:length] for word in words for length in (1, 3, 5)]:
+            with self.subTest(query=query), mock.patch.object(index, '_suffix', wraps=index._suffix) as reads:
+                products = index.search(query, SUGGEST_LIMIT)[0]
+
+                self.assertEqual(len(products), SUGGEST_LIMIT)
+                for product in products:
+                    self.assertTrue(any(word.startswith(query) for word in product['name'].split()))
+                self.assertLessEqual(reads.call_count, max_reads)
+
+
+# === Idempotency-Key ===
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(stock=5)
+        self.client.force_login(User.objects.create_user('buyer'))
+
+    def add_item(self, key):
+        return self.client.post(
+            '/api/cart/add_item/', {'product_id': self.product.id},
+            content_type='application/json', headers={'Idempotency-Key': key},
+        )
+
+    def test_repeat_is_replayed(self):
+        self.add_item('key-1')
+        response = self.add_item('key-1')
+
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+
+    def test_result_stored_while_acquiring_lock_is_replayed(self):
+        original_add = cache.add
+        raced = []
+
+        def add(key, *args, **kwargs):
+            # Первый запрос целиком выполняется между проверкой кеша и cache.add дубликата
+            if key.endswith(':lock') and not raced:
+                raced.append(key)
+                self.add_item('key-2')
+            return original_add(key, *args, **kwargs)
+
+        with mock.patch.object(cache, 'add', side_effect=add):
+            response = self.add_item('key-2')
+
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+
+
+# === Акции и купоны (promotions.py) ===
+class PromotionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.dict(promotions._state, {'plan': None, 'version': None, 'built': 0.0}))
+        self.product = make_product(new_price=Decimal('40.00'))
+
+    def price(self, quantity=1, coupon=None):
+        return promotions.get_plan().price(
+            [(self.product.id, self.product.category_id, self.product.new_price, quantity)], coupon
+        )
+
+    def test_best_single_discount_per_line(self):
+        Promotion.objects.create(name='10%', kind='percent', value=10).products.add(self.product)
+        Promotion.objects.create(name='3 for 90', kind='bundle', value=90, bundle_quantity=3)
+
+        self.assertEqual(self.price(1)['discount'], Decimal('4.00'))
+        self.assertEqual(self.price(3)['discount'], Decimal('30.00'))
+
+    def test_coupon_only_with_code(self):
+        Promotion.objects.create(name='Coupon', kind='fixed', value=5, code='SAVE5')
+
+        self.assertEqual(self.price()['discount'], 0)
+        self.assertEqual(self.price(coupon=' save5 ')['discount'], Decimal('5.00'))
+
+    def test_plan_expires_without_version_bump(self):
+        promotion = Promotion.objects.create(name='10%', kind='percent', value=10)
+        self.assertEqual(self.price()['discount'], Decimal('4.00'))
+
+        # Правка из другого процесса: версия в локальном кеше этого процесса не меняется
+        Promotion.objects.filter(pk=promotion.pk).update(value=20)
+        self.assertEqual(self.price()['discount'], Decimal('4.00'))
+
+        later = time.monotonic() + promotions.PLAN_MAX_AGE + 1
+        with mock.patch.object(promotions.time, 'monotonic', return_value=later):
+            self.assertEqual(self.price()['discount'], Decimal('8.00'))
+
+
+# === История цен ===
+class PriceHistoryTests(TestCase):
+    def test_chart_prices_are_decimal_strings(self):
+        product = make_product(new_price=Decimal('80'))
+        product.new_price = Decimal('64.50')
+        product.save()
+
+        response = self.client.get(f'/api/products/{product.id}/price_history/')
+
+        self.assertEqual([point['price'] for point in response.json()['points']], ['80.00', '64.50'])
+
+    def test_unknown_product(self):
+        self.assertEqual(self.client.get('/api/products/abc/price_history/').status_code, 404)
+
+
+# === Архивация и суммы заказов ===
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        self.product = make_product()
+
+    def make_orders(self, orders, lines):
+        for _ in range(orders):
+            order = Order.objects.create(user=self.user, status='Delivered', total=10 * lines)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=self.product, quantity=1, price=10) for _ in range(lines)
+            )
+
+    def test_batch_moves_orders_with_their_totals(self):
+        self.make_orders(20, 100)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(archive_batch(Order.objects.order_by('id')), 20)
+
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in queries.captured_queries))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(ArchivedOrderItem.objects.count(), 2000)
+        self.assertEqual(set(ArchivedOrder.objects.values_list('total', flat=True)), {1000})
+
+    def test_archived_orders_read_the_same(self):
+        self.client.force_login(self.user)
+        self.make_orders(3, 2)
+        old_ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+        Order.objects.filter(id__in=old_ids[:2]).update(created_at=timezone.now() - timedelta(days=400))
+        Order.objects.filter(id=old_ids[1]).update(status='Cancelled')
+        pending = Order.objects.create(user=self.user)
+        Order.objects.filter(pk=pending.pk).update(created_at=timezone.now() - timedelta(days=400))
+        before = {order_id: self.client.get(f'/api/orders/{order_id}/').json() for order_id in old_ids[:2]}
+
+        call_command('archive_orders', days=365, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), old_ids[:2])
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), [old_ids[2], pending.id])
+        for order_id, data in before.items():
+            self.assertEqual(self.client.get(f'/api/orders/{order_id}/').json(), data)
+        history = self.client.get('/api/orders/', {'include_archived': 'true'}).json()['results']
+        self.assertEqual({order['id'] for order in history}, {*old_ids, pending.id})
+
+    def test_deleting_an_order_skips_line_totals(self):
+        self.make_orders(1, 50)
+
+        with CaptureQueriesContext(connection) as queries:
+            Order.objects.all().delete()
+
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in queries.captured_queries))
+
+    def test_deleting_a_line_still_updates_total(self):
+        self.make_orders(1, 0)
+        order = Order.objects.get()
+        first = OrderItem.objects.create(order=order, product=self.product, quantity=2, price=10)
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price=5)
+
+        first.delete()
+
+        order.refresh_from_db()
+        self.assertEqual(order.total, 5)
+
+
+# === Брошенные корзины (abandoned_carts.py) ===
+class AbandonedCartTests(TestCase):
+    def setUp(self):
+        self.product = make_product(new_price=10)
+
+    def add_line(self, username, days_ago, quantity=1):
+        user = User.objects.get_or_create(username=username)[0]
+        item = CartItem.objects.create(user=user, product=self.product, quantity=quantity)
+        CartItem.objects.filter(pk=item.pk).update(updated_at=timezone.now() - timedelta(days=days_ago))
+        return item
+
+    def test_deletes_only_carts_untouched_as_a_whole(self):
+        abandoned = [self.add_line('gone', 40, quantity=2), self.add_line('gone', 35)]
+        self.add_line('returning', 40)
+        self.add_line('returning', 1)
+        self.add_line('active', 0)
+
+        output = StringIO()
+        call_command('cleanup_abandoned_carts', days=30, dry_run=True, stdout=output)
+        self.assertIn('Abandoned carts: 1, lines: 2, units: 3, value: $30.00', output.getvalue())
+        self.assertEqual(CartItem.objects.count(), 5)
+
+        call_command('cleanup_abandoned_carts', days=30, batch_size=1, pause=0, stdout=StringIO())
+
+        self.assertFalse(CartItem.objects.filter(id__in=[item.id for item in abandoned]).exists())
+        self.assertEqual(
+            sorted(CartItem.objects.values_list('user__username', flat=True)), ['active', 'returning', 'returning']
+        )
+
+
+# === Бенчмарк: один товар, много покупателей ===
+class StockContentionBenchmark(TransactionTestCase):
+    """
+    Покупатели разбирают последние единицы одного товара. Проверяем, что
+    товар не продаётся сверх остатка; время на оформление печатает
+    test_checkout_benchmark (--tag benchmark). Параллельные варианты требуют
+    настоящих блокировок строк (PostgreSQL); на SQLite выполняется только
+    последовательный.
+    """
+
+    BUYERS = 200
+
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            [User(username=f'buyer{index}') for index in range(self.BUYERS)]
+        )
+
+    def checkout(self, user, product):
+        try:
+            with transaction.atomic():
+                sync_reservation(user, product.id, 1)
+                commit_cart(user, {(product.id, None): 1})
+        except OutOfStock:
+            return False
+        return True
+
+    def test_sequential_checkouts(self):
+        product = make_product(stock=self.BUYERS // 2)
+
+        sold = sum(self.checkout(user, product) for user in self.users)
+
+        product.refresh_from_db()
+        self.assertEqual(sold, self.BUYERS // 2)
+        self.assertEqual(product.stock, 0)
+
+    @tag('benchmark')
+    def test_checkout_benchmark(self):
+        product = make_product(stock=self.BUYERS // 2)
+
+        started = time.perf_counter()
+        for user in self.users:
+            self.checkout(user, product)
+        elapsed = time.perf_counter() - started
+
+        print(f'\nstock contention: {self.BUYERS} checkouts took {elapsed:.3f}s')
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_checkouts_never_oversell(self):
+        buyers = 20
+        product = make_product(stock=buyers // 2)
+
+        results = run_in_threads(lambda index: self.checkout(self.users[index], product), buyers)
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(True), buyers // 2)
+        self.assertEqual(product.stock, 0)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_cancels_restock_once(self):
+        product = make_product(stock=1)
+        user = self.users[0]
+        self.assertTrue(self.checkout(user, product))
+        order = Order.objects.create(user=user)
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=product.new_price)
+
+        changed = run_in_threads(lambda index: set_status(Order.objects.filter(pk=order.pk), 'Cancelled'), 4)
+
+        product.refresh_from_db()
+        self.assertEqual(sum(changed), 1)
+        self.assertEqual(product.stock, 1)
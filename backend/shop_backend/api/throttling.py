@@ -0,0 +1,98 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+# === Throttle со скользящим окном ===
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Счётчик скользящего окна поверх кеша.
+
+    Вместо списка временных меток (как в SimpleRateThrottle) храним два
+    целых счётчика — для текущего и предыдущего окна — и оцениваем нагрузку
+    как prev * (доля предыдущего окна, попадающая в интервал) + current.
+    Проверка стоит один get_many и один add/incr, размер записи в кеше
+    не зависит от лимита.
+    """
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+
+        current_key = f'{self.key}:{window}'
+        previous_key = f'{self.key}:{window - 1}'
+        counts = self.cache.get_many([current_key, previous_key])
+        self.previous = counts.get(previous_key, 0)
+        current = counts.get(current_key, 0)
+
+        weight = 1 - self.elapsed / self.duration
+        self.estimated = self.previous * weight + current
+
+        if self.estimated >= self.num_requests:
+            self._store_status(request, remaining=0)
+            return self.throttle_failure()
+
+        # Счётчик живёт два окна: в следующем окне он станет «предыдущим»
+        if self.cache.add(current_key, 1, self.duration * 2):
+            current = 1
+        else:
+            try:
+                current = self.cache.incr(current_key)
+            except ValueError:
+                # Ключ успел истечь между add и incr
+                self.cache.set(current_key, 1, self.duration * 2)
+                current = 1
+
+        remaining = self.num_requests - (self.previous * weight + current)
+        self._store_status(request, remaining=max(0, int(remaining)))
+        return True
+
+    def wait(self):
+        until_next_window = self.duration - self.elapsed
+        if not self.previous:
+            return until_next_window
+        # Оценка убывает со скоростью previous / duration до конца окна
+        decay = (self.estimated - self.num_requests + 1) * self.duration / self.previous
+        return min(decay, until_next_window)
+
+    def _store_status(self, request, remaining):
+        # Сохраняем на Django-запросе, заголовки добавляет RateLimitHeadersMiddleware
+        request._request.rate_limit = {
+            'limit': self.num_requests,
+            'remaining': remaining,
+            'reset': int(self.duration - self.elapsed),
+        }
+
+
+class AuthRateThrottle(SlidingWindowRateThrottle):
+    """Регистрация и логин: лимит по IP, независимо от сессии."""
+    scope = 'auth'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
+
+class CartRateThrottle(SlidingWindowRateThrottle):
+    """Изменения корзины: лимит по пользователю, для анонимов — по IP."""
+    scope = 'cart'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': ident
+        }
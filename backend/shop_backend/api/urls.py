@@ -10,6 +10,8 @@ router.register(r'cart', views.CartItemViewSet, basename='cart')
 router.register(r'orders', views.OrderViewSet, basename='order')
 
 urlpatterns = [
+    # До роутера: иначе 'events' попадёт в orders/<pk>/
+    path('orders/events/', views.order_events, name='order-events'),
     path('', include(router.urls)),
 
     # Пользовательские эндпоинты
@@ -17,4 +19,7 @@ urlpatterns = [
     path('login/', views.login_user, name='login'),
     path('logout/', views.logout_user, name='logout'),
     path('check-auth/', views.check_auth, name='check-auth'),
+
+    # Мониторинг
+    path('outbox/stats/', views.outbox_lag, name='outbox-stats'),
 ]
\ No newline at end of file
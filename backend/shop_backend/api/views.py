@@ -1,45 +1,163 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, status, filters
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, action
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import api_view, action, permission_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Category, Product, CartItem, Order, OrderItem
+from .models import Category, Product, ProductVariant, CartItem, Order, OrderItem, ArchivedOrder, subtree_q
 from .serializers import (
     CategorySerializer, 
     ProductSerializer, 
     ProductCreateSerializer,
     CartItemSerializer, 
     OrderSerializer,
+    OrderSummarySerializer,
     OrderCreateSerializer,
     RegisterSerializer,
     LoginSerializer
 )
+from .throttling import AuthRateThrottle, CartRateThrottle
+from .fieldsets import optimize_queryset, sparse_fields_requested
+from .pagination import CombinedHistoryPagination, OrderHistoryPagination
+from .exports import CONTENT_TYPES, EXPORT_CHUNK_SIZE, streaming_export
+from .filters import ProductFilter, product_facets
+from .guest_cart import GuestCart
+from .idempotency import idempotent
+from .permissions import IsStaffOrPartner
+from .recommendations import MAX_RELATED_LIMIT, RELATED_LIMIT, related_product_ids
+from .similarity import MAX_SIMILAR_LIMIT, SIMILAR_LIMIT, similar_product_ids
+from .suggest import MAX_SUGGEST_LIMIT, SUGGEST_LIMIT, catalog_version, suggestions
+from .inventory import OutOfStock, release_user_reservations, sync_reservation
+from .events import order_event_stream, set_status
+from .outbox import outbox_stats
+from .promotions import price_cart
+from .price_history import CHART_DAYS, price_chart
+from .cache_tags import SurrogateKeyMixin, product_key
+from .compression import precompressed_cache_key, precompressed_response, store_precompressed
+
+
+class AtomicWriteMixin:
+    """Изменение объекта и его событие в outbox (signals.py) — одной транзакцией."""
+    
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            super().perform_create(serializer)
+    
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            super().perform_update(serializer)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            super().perform_destroy(instance)
 
 
 # === Категории ===
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+class CategoryViewSet(SurrogateKeyMixin, AtomicWriteMixin, viewsets.ModelViewSet):
+    # Порядок по path: родитель сразу перед своими потомками
+    queryset = Category.objects.order_by('path')
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+    cache_scope = 'categories'
+    key_prefix = 'category'
+    
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """Всё дерево категорий вложенными children — одним запросом."""
+        nodes, roots = {}, []
+        for category in self.get_queryset():
+            node = {**self.get_serializer(category).data, 'children': []}
+            nodes[category.id] = node
+            # Сортировка по path гарантирует, что родитель уже в nodes
+            parent = nodes.get(category.parent_id)
+            (parent['children'] if parent else roots).append(node)
+        return Response(roots)
+
+
+# Варианты всех товаров страницы — одним запросом, независимо от числа товаров
+def variants_prefetch(lookup='variants'):
+    return Prefetch(lookup, queryset=ProductVariant.objects.order_by('id'))
 
 
 # === Товары ===
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SurrogateKeyMixin, AtomicWriteMixin, viewsets.ModelViewSet):
     queryset = Product.objects.select_related('category').all()
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'category__name']
+    filterset_class = ProductFilter
     search_fields = ['name', 'description']
     ordering_fields = ['new_price', 'name', 'id']
     ordering = ['id']
+    cache_scope = 'products'
+    key_prefix = 'product'
+    # Параметры списка, при которых ответ кешируется уже сжатым
+    precompressed_params = frozenset([
+        *ProductFilter.base_filters, 'search', 'ordering', 'facets', 'fields', 'expand', 'format',
+    ])
+    
+    def surrogate_keys(self, response):
+        keys = super().surrogate_keys(response)
+        if self.action in ('related', 'similar'):
+            # Подборка зависит от каждого товара в ней
+            keys.extend(product_key(item['id']) for item in response.data)
+        return keys
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if sparse_fields_requested(self.request):
+            # Тянем из БД только поля, запрошенные через ?fields=
+            return optimize_queryset(queryset, self.get_serializer())
+        return queryset.prefetch_related(variants_prefetch())
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return ProductCreateSerializer
         return ProductSerializer
     
+    def list(self, request, *args, **kwargs):
+        # Горячий путь: готовые сжатые байты из кеша, без сериализации и сжатия
+        cache_key = None
+        if request.accepted_renderer.format == 'json':
+            cache_key = precompressed_cache_key(request, catalog_version(), self.precompressed_params)
+        if cache_key:
+            entry = cache.get(cache_key)
+            if entry is not None:
+                return precompressed_response(request, entry)
+        
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('1', 'true'):
+            # ?facets=true: счётчики для боковой панели рядом с результатами
+            response.data = {
+                'results': response.data,
+                'facets': product_facets(self.facet_queryset)
+            }
+        
+        if cache_key and response.status_code == 200:
+            response.accepted_renderer = request.accepted_renderer
+            response.accepted_media_type = request.accepted_media_type
+            response.renderer_context = self.get_renderer_context()
+            return precompressed_response(request, store_precompressed(cache_key, response))
+        return response
+    
+    def facet_queryset(self, facet):
+        """Выборка со всеми фильтрами запроса, кроме фильтров этого фасета."""
+        params = self.request.query_params.copy()
+        for name in ProductFilter.FACET_PARAMS[facet]:
+            params.pop(name, None)
+        queryset = filters.SearchFilter().filter_queryset(self.request, Product.objects.all(), self)
+        return ProductFilter(params, queryset=queryset, request=self.request).qs
+    
     @action(detail=False, methods=['get'])
     def by_category(self, request):
         category_name = request.query_params.get('category', '').lower()
@@ -50,7 +168,8 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
         try:
             category = Category.objects.get(name__iexact=category_name)
-            products = Product.objects.filter(category=category)
+            # Товары категории и всех её подкатегорий — один запрос по индексу path (subtree_q)
+            products = self.get_queryset().filter(subtree_q(category.path, prefix='category__'))
             serializer = self.get_serializer(products, many=True)
             return Response(serializer.data)
         except Category.DoesNotExist:
@@ -58,15 +177,127 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def popular(self, request):
-        products = Product.objects.all()[:4]
+        products = self.get_queryset()[:4]
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def new_collections(self, request):
-        products = Product.objects.all().order_by('-id')[:8]
+        products = self.get_queryset().order_by('-id')[:8]
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Подсказки для строки поиска из индекса в памяти: /api/products/suggest/?q=бл"""
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', SUGGEST_LIMIT)), MAX_SUGGEST_LIMIT)
+        except ValueError:
+            limit = SUGGEST_LIMIT
+        return Response(suggestions(query, max(limit, 1)))
+    
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """С этим товаром покупают: /api/products/<id>/related/?limit=8"""
+        try:
+            product_id = int(pk)
+        except ValueError:
+            return Response({'error': 'Invalid product id'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', RELATED_LIMIT)), MAX_RELATED_LIMIT)
+        except ValueError:
+            limit = RELATED_LIMIT
+        
+        ids = related_product_ids(product_id, max(limit, 1))
+        # Пустой ответ — либо товар без пар, либо его нет: проверяем только тогда
+        if not ids and not Product.objects.filter(pk=product_id).exists():
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.serialize_ids(ids))
+    
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Похожие по названию и описанию: /api/products/<id>/similar/?limit=8"""
+        try:
+            product_id = int(pk)
+            limit = min(int(request.query_params.get('limit', SIMILAR_LIMIT)), MAX_SIMILAR_LIMIT)
+        except ValueError:
+            return Response({'error': 'Invalid product id or limit'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        ids = similar_product_ids(product_id, max(limit, 1))
+        # Как в related: пустой ответ — проверяем, что товар есть
+        if not ids and not Product.objects.filter(pk=product_id).exists():
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.serialize_ids(ids))
+    
+    @action(detail=True, methods=['get'])
+    def price_history(self, request, pk=None):
+        """График цены: /api/products/<id>/price_history/?since=&until= (ISO 8601, по умолчанию — последний год)"""
+        bounds = {}
+        for name in ('since', 'until'):
+            value = request.query_params.get(name)
+            if not value:
+                continue
+            moment = parse_datetime(value)
+            if moment is None:
+                return Response(
+                    {'error': f'{name} must be an ISO 8601 datetime'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            bounds[name] = timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+        until = bounds.get('until', timezone.now())
+        since = bounds.get('since', until - timedelta(days=CHART_DAYS))
+        
+        if not pk.isdigit() or not Product.objects.filter(pk=pk).exists():
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'product_id': int(pk),
+            'since': since,
+            'until': until,
+            'points': price_chart(int(pk), since, until),
+        })
+    
+    def serialize_ids(self, ids):
+        """Товары по списку id в том же порядке — одним запросом."""
+        products = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [products[product_id] for product_id in ids if product_id in products], many=True
+        )
+        return serializer.data
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsStaffOrPartner])
+    def export(self, request):
+        """
+        Потоковая выгрузка каталога для партнёров:
+        /api/products/export/?type=ndjson|csv&since=2025-01-01T00:00:00Z
+        """
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in CONTENT_TYPES:
+            return Response(
+                {'error': 'type must be one of: ' + ', '.join(CONTENT_TYPES)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        products = Product.objects.order_by('updated_at', 'id')
+        since = request.query_params.get('since')
+        if since:
+            since_dt = parse_datetime(since)
+            if since_dt is None:
+                return Response(
+                    {'error': 'since must be an ISO 8601 datetime'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since_dt):
+                since_dt = timezone.make_aware(since_dt)
+            products = products.filter(updated_at__gt=since_dt)
+        
+        header = ['id', 'name', 'category', 'description', 'old_price', 'new_price',
+                  'image', 'stock', 'updated_at']
+        rows = products.values_list(
+            'id', 'name', 'category__name', 'description', 'old_price', 'new_price',
+            'image', 'stock', 'updated_at'
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return streaming_export(export_type, header, rows, 'products')
 
 
 # === Корзина ===
@@ -77,56 +308,124 @@ class CartItemViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            return CartItem.objects.filter(user=self.request.user).select_related('product', 'product__category')
+            return CartItem.objects.filter(user=self.request.user).select_related(
+                'product', 'product__category', 'variant'
+            ).prefetch_related(variants_prefetch('product__variants'))
         return CartItem.objects.none()
     
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            # Гостевая корзина из кеша
+            serializer = self.get_serializer(GuestCart(request).cart_items(), many=True)
+            return Response(serializer.data)
+        return super().list(request, *args, **kwargs)
+    
+    def guest_line_response(self, cart, product, variant_id, quantity):
+        """Сохраняет гостевую корзину и отдаёт изменённую строку."""
+        cart.set(product.id, variant_id, quantity)
+        if quantity > 0:
+            item = CartItem(product=product, variant_id=variant_id, quantity=quantity)
+            response = Response(self.get_serializer(item).data, status=status.HTTP_200_OK)
+        else:
+            response = Response({'message': 'Item removed from cart'}, status=status.HTTP_200_OK)
+        cart.save(response)
+        return response
+    
+    def out_of_stock_response(self, exc):
+        return Response(
+            {'error': 'Not enough stock', 'product_ids': exc.product_ids},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        quantity = serializer.validated_data.get('quantity', instance.quantity)
+        try:
+            sync_reservation(self.request.user, instance.product_id, quantity, variant_id=instance.variant_id)
+        except OutOfStock as exc:
+            raise ValidationError({'error': 'Not enough stock', 'product_ids': exc.product_ids})
+        serializer.save()
+    
+    def perform_destroy(self, instance):
+        sync_reservation(self.request.user, instance.product_id, 0, variant_id=instance.variant_id)
+        instance.delete()
+    
     # 🚨 ИСПРАВЛЕНИЕ: Добавляем action для /api/cart/add_item/
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_classes=[CartRateThrottle])
+    @idempotent
     def add_item(self, request):
         """Добавляет или увеличивает количество товара в корзине"""
-        if not request.user.is_authenticated:
-            return Response(
-                {'error': 'Authentication required'}, 
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-
         product_id = request.data.get('product_id')
+        variant_id = request.data.get('variant_id')
         
         try:
             product = Product.objects.get(id=product_id)
         except Product.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if variant_id and not product.variants.filter(id=variant_id).exists():
+            return Response({'error': 'Variant not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # У товара с размерами остаток ведётся по SKU — без варианта позицию не добавить
+        if not variant_id and product.variants.exists():
+            return Response({'error': 'variant_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not request.user.is_authenticated:
+            # Гость: корзина в кеше, без записи в БД и без брони остатка
+            cart = GuestCart(request)
+            return self.guest_line_response(
+                cart, product, variant_id, cart.quantity(product.id, variant_id) + 1
+            )
 
-        cart_item, created = CartItem.objects.get_or_create(
-            user=request.user,
-            product=product,
-            defaults={'quantity': 1}
-        )
+        cart_item = CartItem.objects.filter(user=request.user, product=product, variant_id=variant_id).first()
+        
+        # Бронируем ещё одну единицу остатка
+        try:
+            sync_reservation(
+                request.user, product.id, (cart_item.quantity if cart_item else 0) + 1,
+                variant_id=variant_id
+            )
+        except OutOfStock as exc:
+            return self.out_of_stock_response(exc)
         
-        if not created:
+        if cart_item:
             cart_item.quantity += 1
             cart_item.save()
+        else:
+            cart_item = CartItem.objects.create(
+                user=request.user, product=product, variant_id=variant_id, quantity=1
+            )
         
         serializer = self.get_serializer(cart_item)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     # 🚨 ИСПРАВЛЕНИЕ: Добавляем action для /api/cart/remove_item/
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_classes=[CartRateThrottle])
+    @idempotent
     def remove_item(self, request):
         """Уменьшает количество товара в корзине или удаляет его"""
-        if not request.user.is_authenticated:
-            return Response(
-                {'error': 'Authentication required'}, 
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-        
         product_id = request.data.get('product_id')
+        variant_id = request.data.get('variant_id')
+        
+        if not request.user.is_authenticated:
+            cart = GuestCart(request)
+            quantity = cart.quantity(product_id, variant_id)
+            product = Product.objects.filter(id=product_id).first() if quantity else None
+            if product is None:
+                return Response({'error': 'Item not found in cart'}, status=status.HTTP_404_NOT_FOUND)
+            return self.guest_line_response(cart, product, variant_id, quantity - 1)
         
         try:
-            cart_item = CartItem.objects.get(user=request.user, product_id=product_id)
+            cart_item = CartItem.objects.get(user=request.user, product_id=product_id, variant_id=variant_id)
         except CartItem.DoesNotExist:
             return Response({'error': 'Item not found in cart'}, status=status.HTTP_404_NOT_FOUND)
 
+        # Уменьшение только отпускает бронь: истёкшая бронь не добирается со склада
+        sync_reservation(
+            request.user, cart_item.product_id, cart_item.quantity - 1,
+            variant_id=variant_id, release_only=True
+        )
+        
         if cart_item.quantity > 1:
             cart_item.quantity -= 1
             cart_item.save()
@@ -138,34 +437,42 @@ class CartItemViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def total(self, request):
-        if not request.user.is_authenticated:
-            return Response({
-                'total': 0,
-                'count': 0,
-                'message': 'User not authenticated'
-            })
+        if request.user.is_authenticated:
+            cart_items = self.get_queryset()
+        else:
+            cart_items = GuestCart(request).cart_items()
         
-        cart_items = self.get_queryset()
-        total = sum(item.subtotal() for item in cart_items)
+        coupon = request.query_params.get('coupon')
+        pricing = price_cart(cart_items, coupon)
+        if coupon and pricing['coupon'] is None:
+            return Response(
+                {'error': 'Invalid coupon'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         count = sum(item.quantity for item in cart_items)
         
         return Response({
-            'total': total,
+            'subtotal': pricing['subtotal'],
+            'discount': pricing['discount'],
+            'total': pricing['total'],
+            'coupon': pricing['coupon'],
             'count': count
         })
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def clear(self, request):
         if not request.user.is_authenticated:
-            return Response(
-                {'error': 'Authentication required'}, 
-                status=status.HTTP_401_UNAUTHORIZED
-            )
+            response = Response({'message': 'Cart cleared successfully'})
+            GuestCart(request).discard(response)
+            return response
         
+        release_user_reservations(request.user)
         self.get_queryset().delete()
         return Response({'message': 'Cart cleared successfully'})
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def update_quantity(self, request, pk=None):
         if not request.user.is_authenticated:
             return Response(
@@ -176,6 +483,14 @@ class CartItemViewSet(viewsets.ModelViewSet):
         cart_item = self.get_object()
         quantity = request.data.get('quantity', 1)
         
+        try:
+            sync_reservation(
+                request.user, cart_item.product_id, max(quantity, 0), variant_id=cart_item.variant_id,
+                release_only=quantity < cart_item.quantity
+            )
+        except OutOfStock as exc:
+            return self.out_of_stock_response(exc)
+        
         if quantity <= 0:
             cart_item.delete()
             return Response({'message': 'Item removed from cart'})
@@ -191,24 +506,88 @@ class CartItemViewSet(viewsets.ModelViewSet):
 class OrderViewSet(viewsets.ModelViewSet):
     # ... (Остальной код OrderViewSet без изменений)
     permission_classes = [AllowAny]
+    pagination_class = OrderHistoryPagination
     
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            return Order.objects.filter(user=self.request.user).prefetch_related('order_items__product')
-        return Order.objects.none()
+        if not self.request.user.is_authenticated:
+            return Order.objects.none()
+        
+        queryset = Order.objects.filter(user=self.request.user)
+        if self.action == 'create':
+            return queryset
+        if sparse_fields_requested(self.request):
+            # created_at нужен курсору пагинации, даже если его нет в ?fields=
+            return optimize_queryset(queryset, self.get_serializer(), extra_only=['created_at'])
+        if self.action == 'list':
+            # Краткий список: позиции заказа не загружаем, считаем их в SQL
+            return queryset.only('id', 'created_at', 'status', 'total').annotate(
+                items_count=Count('order_items')
+            )
+        return queryset.select_related('user').prefetch_related(
+            'order_items__product__category',
+            'order_items__variant',
+            variants_prefetch('order_items__product__variants'),
+        )
     
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderCreateSerializer
+        if self.action == 'list' and not sparse_fields_requested(self.request):
+            # Полные позиции — только в детальном ответе /api/orders/<id>/
+            return OrderSummarySerializer
         return OrderSerializer
     
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        # Повтор оформления после таймаута не создаёт второй заказ
+        return super().create(request, *args, **kwargs)
+    
+    def include_archived(self):
+        return self.request.query_params.get('include_archived') == 'true'
+    
     def list(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return Response({
                 'results': [],
                 'message': 'User not authenticated'
             })
-        return super().list(request, *args, **kwargs)
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+        
+        # Живые и архивные заказы одной лентой, краткий формат
+        querysets = [
+            model.objects.filter(user=request.user)
+            .only('id', 'created_at', 'status', 'total')
+            .annotate(items_count=Count('order_items'))
+            for model in (Order, ArchivedOrder)
+        ]
+        paginator = CombinedHistoryPagination()
+        page = paginator.paginate_querysets(querysets, request)
+        serializer = OrderSummarySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            if not request.user.is_authenticated:
+                raise
+        
+        # Заказ мог уйти в архив (archive_orders) — старые ссылки продолжают работать
+        order = (
+            ArchivedOrder.objects.filter(user=request.user, pk=kwargs['pk'])
+            .select_related('user')
+            .prefetch_related(
+                'order_items__product__category',
+                'order_items__variant',
+                variants_prefetch('order_items__product__variants'),
+            )
+            .first()
+        )
+        if order is None:
+            raise Http404
+        serializer = OrderSerializer(order, context=self.get_serializer_context())
+        return Response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
@@ -220,27 +599,54 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         order = self.get_object()
         
+        # Условный UPDATE под блокировкой: товары вернёт только та отмена,
+        # что действительно перевела заказ в Cancelled
+        set_status(Order.objects.filter(pk=order.pk).exclude(status='Delivered'), 'Cancelled')
+        order.refresh_from_db(fields=['status'])
         if order.status == 'Delivered':
             return Response(
                 {'error': 'Cannot cancel delivered order'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        order.status = 'Cancelled'
-        order.save()
-        
         serializer = self.get_serializer(order)
         return Response(serializer.data)
 
 
+async def order_events(request):
+    """SSE: смены статуса заказов пользователя (text/event-stream, нужен ASGI)."""
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI поток занял бы рабочий поток на всё соединение
+        return JsonResponse(
+            {'error': 'Order events need an ASGI server; poll /api/orders/ instead'}, status=501
+        )
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    return StreamingHttpResponse(
+        order_event_stream(user.id),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def outbox_lag(request):
+    """Метрики отставания релея outbox для мониторинга."""
+    return Response(outbox_stats())
+
+
 # === Аутентификация ===
 @api_view(['POST'])
+@throttle_classes([AuthRateThrottle])
 def register_user(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
         login(request, user)
-        return Response({
+        response = Response({
             'success': True,
             'message': 'User registered successfully',
             'user': {
@@ -249,6 +655,11 @@ def register_user(request):
                 'email': user.email
             }
         }, status=status.HTTP_201_CREATED)
+        # Переносим гостевую корзину в аккаунт
+        guest_cart = GuestCart(request)
+        guest_cart.merge_into(user)
+        guest_cart.discard(response)
+        return response
     return Response({
         'success': False,
         'errors': serializer.errors
@@ -256,6 +667,7 @@ def register_user(request):
 
 
 @api_view(['POST'])
+@throttle_classes([AuthRateThrottle])
 def login_user(request):
     serializer = LoginSerializer(data=request.data)
     if not serializer.is_valid():
@@ -271,7 +683,7 @@ def login_user(request):
     
     if user is not None:
         login(request, user)
-        return Response({
+        response = Response({
             'success': True,
             'message': 'Login successful',
             'user': {
@@ -280,6 +692,10 @@ def login_user(request):
                 'email': user.email
             }
         }, status=status.HTTP_200_OK)
+        guest_cart = GuestCart(request)
+        guest_cart.merge_into(user)
+        guest_cart.discard(response)
+        return response
     else:
         return Response({
             'success': False,
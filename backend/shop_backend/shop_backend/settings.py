@@ -10,7 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
+from corsheaders.defaults import default_headers
+from django.conf import global_settings
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    # Сжатие — снаружи всех, кто может менять тело ответа
+    'api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'shop_backend.urls'
@@ -102,6 +108,31 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Профиль хеширования паролей.
+# 'default' — стандартные хешеры Django (PBKDF2), используются в продакшене.
+# 'fast' — только для тестов и нагрузочных стендов: новые пароли хешируются
+# быстрым MD5, чтобы регистрация и сидинг пользователей не упирались в CPU.
+# Стандартные хешеры остаются в списке — существующие PBKDF2/Argon2-хеши
+# по-прежнему проверяются.
+PASSWORD_HASHER_PROFILE = os.environ.get('DJANGO_PASSWORD_HASHER_PROFILE', 'default')
+
+if PASSWORD_HASHER_PROFILE == 'fast':
+    PASSWORD_HASHERS = [
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+        *global_settings.PASSWORD_HASHERS,
+    ]
+
+
+# Django REST Framework
+# Лимиты для дорогих эндпоинтов (хеширование паролей, запись корзины).
+# Счётчики хранятся в кеше 'default' (см. api/throttling.py).
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': '10/min',
+        'cart': '120/min',
+    },
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -120,6 +151,75 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Media (варианты изображений товаров, загрузки из админки)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Пайплайн изображений товаров (api/images.py)
+PRODUCT_IMAGE_SOURCE_DIR = BASE_DIR.parent.parent / 'Ecommerce_Frontend_Assets' / 'Assets'
+PRODUCT_IMAGE_WIDTHS = [160, 320]
+PRODUCT_IMAGE_FORMATS = ['webp', 'jpeg']
+
+# Индекс похожих товаров (api/similarity.py, команда build_similarity_index)
+SIMILARITY_INDEX_DIR = BASE_DIR / 'similarity_index'
+
+# Бронь остатка под товар в корзине, секунд (api/inventory.py)
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Гостевая корзина живёт в кеше, секунд (api/guest_cart.py).
+# В проде кеш должен быть общим для всех процессов (Redis/Memcached)
+GUEST_CART_TTL = 30 * 24 * 60 * 60
+
+# Ответы на запросы с Idempotency-Key, секунд (api/idempotency.py)
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# Блокировка на время выполнения первого запроса; снимается сама,
+# если процесс упал, не дописав ответ
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Сжатие ответов (api/compression.py): порог в байтах и срок жизни
+# кеша уже сжатых ответов каталога, секунд
+COMPRESSION_MIN_SIZE = 1024
+PRECOMPRESSED_CACHE_TIMEOUT = 60
+
+# Брокер событий о заказах для SSE (api/events.py), интервал keepalive и
+# максимальная длительность одного соединения (потом клиент переподключается), секунд
+ORDER_EVENTS_BROKER = 'api.events.InProcessBroker'
+ORDER_EVENTS_HEARTBEAT = 15
+ORDER_EVENTS_MAX_DURATION = 30 * 60
+
+# Обработчики событий outbox по топику ('*' — для всех), см. api/outbox.py
+OUTBOX_HANDLERS = {
+    '*': ['api.outbox.log_event'],
+    'product.changed': ['api.cache_tags.purge_event'],
+    'product.deleted': ['api.cache_tags.purge_event'],
+    'category.changed': ['api.cache_tags.purge_event'],
+    'category.deleted': ['api.cache_tags.purge_event'],
+}
+
+# Сброс общего HTTP-кеша по surrogate keys (api/cache_tags.py).
+# Например: {'BACKEND': 'api.cache_tags.HttpPurger', 'OPTIONS': {'url': 'http://127.0.0.1:9000/purge'}}
+CACHE_PURGE = {
+    'BACKEND': 'api.cache_tags.LoggingPurger',
+}
+
+# Cache-Control для ответов каталога: '<scope>.<action>' или '<scope>.*'.
+# Правки каталога сбрасываются в общем кеше точечно, но в ответах о товарах
+# есть остатки (stock), а они меняются с каждой бронью без событий — поэтому
+# у products.* s-maxage короткий; max-age для браузера тоже короткий
+CACHE_CONTROL_POLICIES = {
+    'products.*': 'public, max-age=60, s-maxage=60, stale-while-revalidate=60',
+    'products.list': 'public, max-age=30, s-maxage=60, stale-while-revalidate=30',
+    'products.suggest': 'public, max-age=30, s-maxage=300',
+    'products.export': 'private, no-store',
+    'categories.*': 'public, max-age=300, s-maxage=86400, stale-while-revalidate=300',
+}
+
+# Группа пользователей-партнёров с доступом к выгрузке каталога
+PARTNER_GROUP = 'partners'
+
+# Тесты с тегом benchmark запускаются только явно: --tag benchmark (api/runner.py)
+TEST_RUNNER = 'api.runner.TestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -132,6 +232,18 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
+# Заголовки ответа, которые фронт на другом origin может прочитать
+# (api/middleware.py — лимиты запросов, api/idempotency.py — повтор ответа)
+CORS_EXPOSE_HEADERS = [
+    'X-RateLimit-Limit',
+    'X-RateLimit-Remaining',
+    'X-RateLimit-Reset',
+    'Retry-After',
+    'Idempotent-Replayed',
+]
+
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",